@@ -0,0 +1,100 @@
+"""
+This file is part of Security Watch Notifier (sewn.py).
+Copyright (C) 2015 Espen Hovind <espehov@ifi.uio.no>
+
+sewn.py is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+sewn.py is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import threading
+from lib.sewn_clock import SEWNClock
+
+class SEWNAdaptive(object):
+    """
+    Adaptive check intervals.
+
+    A source that had new articles is checked more often (interval divided
+    by [adaptive] speedup) and an idle source less often (multiplied by
+    backoff), within min_interval and max_interval. The interval never goes
+    below what the server or feed asked for (Cache-Control, Retry-After,
+    ttl, sy:updatePeriod).
+    """
+
+    def __init__(self, cfg, logger, scheduler, fetcher):
+        self.logger = logger
+        self.scheduler = scheduler
+        self.fetcher = fetcher
+        self.enabled = cfg.getboolean('adaptive', 'enabled', fallback=False)
+        self.min_interval = cfg.getint('adaptive', 'min_interval', fallback=300)
+        self.max_interval = cfg.getint('adaptive', 'max_interval', fallback=86400)
+        self.speedup = cfg.getfloat('adaptive', 'speedup', fallback=2.0)
+        self.backoff = cfg.getfloat('adaptive', 'backoff', fallback=1.5)
+        self.smoothing = cfg.getfloat('adaptive', 'smoothing', fallback=0.3)
+
+        # source -> dict(base, interval, rate, polls, since, last, latency_gain)
+        self.state = dict()
+        self.lock = threading.Lock()
+
+    def observe(self, source, feed, base, new_articles):
+        """
+        Record the outcome of a check and set the next interval of source.
+        base is the configured check_interval.
+        """
+        if not self.enabled:
+            return
+        now = SEWNClock.monotonic()
+        with self.lock:
+            state = self.state.setdefault(source, {'base': base, 'interval': base,
+                                                   'rate': 0.0, 'polls': 0, 'since': now,
+                                                   'last': now, 'latency_gain': 0.0})
+            elapsed = max(now - state['last'], 1)
+            state['rate'] += self.smoothing * (new_articles / elapsed - state['rate'])
+            state['polls'] += 1
+            state['last'] = now
+
+            interval = state['interval']
+            if new_articles:
+                # Expected detection delay is half the interval
+                state['latency_gain'] += new_articles * (base - interval) / 2
+                interval /= self.speedup
+            else:
+                interval *= self.backoff
+            floor = min(max(self.min_interval, self.fetcher.min_interval(feed)), self.max_interval)
+            interval = int(min(max(interval, floor), self.max_interval))
+            previous, state['interval'] = state['interval'], interval
+            rate = state['rate']
+
+        if interval != previous:
+            self.logger.debug("Adaptive: %s | new: %d | rate: %.2f/h | interval: %d -> %d",
+                              source, new_articles, rate * 3600, previous, interval)
+        self.scheduler.set_interval(source, interval)
+
+    def report(self):
+        """
+        Checks saved compared to fixed intervals, and the summed reduction in
+        detection delay for new articles (seconds, negative if slower).
+        report -> tuple(fetches_saved, latency_gain)
+        """
+        now = SEWNClock.monotonic()
+        saved = 0.0
+        gain = 0.0
+        with self.lock:
+            for state in self.state.values():
+                saved += (now - state['since']) / state['base'] + 1 - state['polls']
+                gain += state['latency_gain']
+        return int(saved), gain
+
+    def log_report(self):
+        if self.enabled:
+            saved, gain = self.report()
+            self.logger.info("Adaptive: fetches saved: %d | detection latency gained: %ds",
+                             saved, gain)
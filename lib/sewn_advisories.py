@@ -0,0 +1,99 @@
+"""
+This file is part of Security Watch Notifier (sewn.py).
+Copyright (C) 2015 Espen Hovind <espehov@ifi.uio.no>
+
+sewn.py is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+sewn.py is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import collections
+import threading
+
+class SEWNAdvisories(object):
+    """
+    Inverted index from CVE and vendor advisory id to articles.
+
+    The first article naming an id owns it. A later article whose ids are
+    all owned already is a follow-up, and is put in the notification
+    cluster of the first one ([advisories] merge_followups): the notifier
+    merges it with the first article within its coalesce window, and
+    suppresses it once that article was notified. Ids listed in the
+    [advisories] watchlist file are notified as critical, never suppressed.
+    """
+
+    Entry = collections.namedtuple('Entry', 'cluster articles')
+
+    def __init__(self, cfg, logger):
+        self.logger = logger
+        self.merge_followups = cfg.getboolean('advisories', 'merge_followups', fallback=True)
+        self.max_ids = cfg.getint('advisories', 'max_ids', fallback=50000)
+        self.max_articles = cfg.getint('advisories', 'max_articles', fallback=20)
+        self.path = cfg.get('advisories', 'watchlist', fallback=None)
+
+        # id -> Entry, oldest first
+        self.index = collections.OrderedDict()
+        self.watchlist = frozenset()
+        self.lock = threading.Lock()
+        if self.path:
+            self.watchlist = self.load_watchlist()
+
+    def __len__(self):
+        return len(self.index)
+
+    def load_watchlist(self):
+        """ One id per line, # starts a comment. """
+        try:
+            with open(self.path, 'r') as f:
+                watchlist = frozenset(line.split('#', 1)[0].strip().upper() for line in f)
+        except OSError as err:
+            self.logger.error("Failed loading watchlist: %s (%s)", self.path, err)
+            return frozenset()
+        watchlist -= {''}
+        self.logger.info("Watchlist: %d ids", len(watchlist))
+        return watchlist
+
+    def add(self, ids, article, cluster):
+        """
+        Index article under its ids. Return the cluster to notify it in,
+        whether it is a follow-up, and the watched ids it names.
+        ids -> frozenset(str), article -> tuple(source, title, link)
+        result -> tuple(cluster, bool, set(str))
+        """
+        if not ids:
+            return cluster, False, set()
+        watched = ids & self.watchlist
+        with self.lock:
+            known = [self.index[i] for i in ids if i in self.index]
+            followup = bool(known) and len(known) == len(ids)
+            if followup and self.merge_followups:
+                cluster = known[0].cluster
+            elif cluster is None:
+                cluster = min(ids)
+
+            for i in ids:
+                entry = self.index.get(i)
+                if entry is None:
+                    entry = self.index[i] = self.Entry(cluster, collections.deque(
+                        maxlen=self.max_articles))
+                    if len(self.index) > self.max_ids:
+                        self.index.popitem(last=False)
+                entry.articles.append(article)
+        if followup:
+            self.logger.debug("Follow-up: [%s] %s | %s", article[0], article[1],
+                              ', '.join(sorted(ids)))
+        return cluster, followup, watched
+
+    def articles(self, advisory):
+        """ Articles naming an id, oldest first. """
+        with self.lock:
+            entry = self.index.get(advisory.upper())
+            return list(entry.articles) if entry else list()
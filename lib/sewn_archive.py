@@ -0,0 +1,243 @@
+"""
+This file is part of Security Watch Notifier (sewn.py).
+Copyright (C) 2015 Espen Hovind <espehov@ifi.uio.no>
+
+sewn.py is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+sewn.py is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+
+class SEWNArchive(object):
+    """
+    Archive of accepted articles, with a local JSON read API.
+
+    Every new article is stored in SQLite at [archive] path with the time
+    it was accepted, the source keywords it matched and its advisory ids.
+    Titles are indexed with FTS5 and keywords in a side table. The API on
+    [archive] host:port answers GET /articles, filtered by source, keyword,
+    since/until (epoch seconds or ISO 8601) and q (full-text query), newest
+    first. Pages are limited to [archive] page_size and continue from the
+    'next' cursor, which is the last id seen, so deep pages stay cheap.
+    """
+    COLUMNS = ('id', 'time', 'source', 'title', 'link', 'keywords', 'ids')
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS articles (id INTEGER PRIMARY KEY, time REAL NOT NULL,
+            source TEXT NOT NULL, title TEXT NOT NULL, link TEXT, keywords TEXT, ids TEXT);
+        CREATE INDEX IF NOT EXISTS articles_source ON articles (source, id);
+        CREATE INDEX IF NOT EXISTS articles_time ON articles (time);
+        CREATE TABLE IF NOT EXISTS keywords (keyword TEXT NOT NULL, id INTEGER NOT NULL,
+            PRIMARY KEY (keyword, id)) WITHOUT ROWID;
+        CREATE VIRTUAL TABLE IF NOT EXISTS articles_text USING fts5(
+            title, content='articles', content_rowid='id');
+    """
+
+    def __init__(self, cfg, logger):
+        self.logger = logger
+        self.path = cfg.get('archive', 'path', fallback=None)
+        self.host = cfg.get('archive', 'host', fallback='127.0.0.1')
+        self.port = cfg.getint('archive', 'port', fallback=0)
+        self.page_size = cfg.getint('archive', 'page_size', fallback=50)
+        self.max_page_size = cfg.getint('archive', 'max_page_size', fallback=500)
+
+        self.lock = threading.Lock()
+        self.db = None
+        self.httpd = None
+        if self.path:
+            try:
+                self.db = self.init_db()
+            except sqlite3.Error as err:
+                self.logger.error("Failed opening archive: %s (%s)", self.path, err)
+
+    def __bool__(self):
+        return self.db is not None
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                               isolation_level=None)
+
+    def init_db(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        db = self.connect()
+        # Readers of the API never block the writer
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(self.SCHEMA)
+        return db
+
+    def add(self, articles):
+        """
+        Store a batch of accepted articles in one transaction.
+        articles -> list(tuple(source, title, link, set(keyword), set(id)))
+        """
+        if self.db is None or not articles:
+            return
+        now = time.time()
+        with self.lock:
+            try:
+                self.db.execute("BEGIN")
+                for source, title, link, keywords, ids in articles:
+                    cursor = self.db.execute(
+                        "INSERT INTO articles (time, source, title, link, keywords, ids) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (now, source, title, link, ','.join(sorted(keywords)),
+                         ','.join(sorted(ids))))
+                    self.db.execute("INSERT INTO articles_text (rowid, title) VALUES (?, ?)",
+                                    (cursor.lastrowid, title))
+                    self.db.executemany("INSERT OR IGNORE INTO keywords VALUES (?, ?)",
+                                        [(keyword.casefold(), cursor.lastrowid)
+                                         for keyword in keywords])
+                self.db.execute("COMMIT")
+            except sqlite3.Error as err:
+                if self.db.in_transaction:
+                    self.db.execute("ROLLBACK")
+                self.logger.error("Failed archiving articles: %s", err)
+
+    def query(self, db, source=None, keyword=None, since=None, until=None, text=None,
+              cursor=None, limit=None):
+        """
+        One page of articles, newest first, and the cursor of the next page.
+        page -> tuple(list(dict), str or None)
+        Raise sqlite3.Error on a bad full-text query.
+        """
+        where = list()
+        params = list()
+        if source:
+            where.append("source = ?")
+            params.append(source)
+        if keyword:
+            where.append("id IN (SELECT id FROM keywords WHERE keyword = ?)")
+            params.append(keyword.casefold())
+        if since is not None:
+            where.append("time >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("time < ?")
+            params.append(until)
+        if text:
+            where.append("id IN (SELECT rowid FROM articles_text WHERE articles_text MATCH ?)")
+            params.append(text)
+        if cursor is not None:
+            where.append("id < ?")
+            params.append(cursor)
+        limit = max(1, min(limit or self.page_size, self.max_page_size))
+
+        sql = "SELECT %s FROM articles" % ', '.join(self.COLUMNS)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY id DESC LIMIT ?"
+        rows = db.execute(sql, params + [limit + 1]).fetchall()
+
+        articles = [self.article(row) for row in rows[:limit]]
+        more = len(rows) > limit
+        return articles, str(articles[-1]['id']) if more else None
+
+    def sources(self, db):
+        rows = db.execute("SELECT source, COUNT(*), MAX(time) FROM articles "
+                          "GROUP BY source ORDER BY source").fetchall()
+        return [{'source': source, 'articles': count, 'last': last}
+                for source, count, last in rows]
+
+    def article(self, row):
+        article = dict(zip(self.COLUMNS, row))
+        article['keywords'] = article['keywords'].split(',') if article['keywords'] else []
+        article['ids'] = article['ids'].split(',') if article['ids'] else []
+        return article
+
+    @staticmethod
+    def parse_time(value):
+        """ Epoch seconds or ISO 8601, ValueError otherwise. """
+        try:
+            return float(value)
+        except ValueError:
+            date = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+            if date.tzinfo is None:
+                date = date.replace(tzinfo=datetime.timezone.utc)
+            return date.timestamp()
+
+    def handle(self, path, query):
+        """
+        Answer one API request.
+        response -> tuple(status, dict)
+        """
+        params = {key: values[-1] for key, values in urllib.parse.parse_qs(query).items()}
+        db = self.connect()
+        try:
+            if path == '/sources':
+                return 200, {'sources': self.sources(db)}
+            if path != '/articles':
+                return 404, {'error': "not found: %s" % path}
+            try:
+                since = self.parse_time(params['since']) if 'since' in params else None
+                until = self.parse_time(params['until']) if 'until' in params else None
+                cursor = int(params['cursor']) if 'cursor' in params else None
+                limit = int(params['limit']) if 'limit' in params else None
+                if limit is not None and limit < 1:
+                    raise ValueError("limit must be positive: %d" % limit)
+            except ValueError as err:
+                return 400, {'error': str(err)}
+            try:
+                articles, cursor = self.query(db, params.get('source'), params.get('keyword'),
+                                              since, until, params.get('q'), cursor, limit)
+            except sqlite3.OperationalError as err:
+                return 400, {'error': str(err)}
+            return 200, {'articles': articles, 'next': cursor}
+        finally:
+            db.close()
+
+    def start(self):
+        """ Serve the read API on [archive] host:port, if a port is configured. """
+        if self.db is None or not self.port:
+            return
+        import http.server
+        archive = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urllib.parse.urlsplit(self.path)
+                try:
+                    status, result = archive.handle(url.path, url.query)
+                except sqlite3.Error as err:
+                    archive.logger.error("Failed reading archive: %s", err)
+                    status, result = 500, {'error': str(err)}
+                body = json.dumps(result).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            self.httpd = http.server.ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as err:
+            self.logger.error("Failed starting archive API: %s", err)
+            return
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, name='archive', daemon=True).start()
+        self.logger.info("Archive API: http://%s:%d/articles", self.host, self.port)
+
+    def close(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
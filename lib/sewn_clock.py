@@ -0,0 +1,44 @@
+"""
+This file is part of Security Watch Notifier (sewn.py).
+Copyright (C) 2015 Espen Hovind <espehov@ifi.uio.no>
+
+sewn.py is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+sewn.py is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import time
+
+class SEWNClock(object):
+    """
+    Time of the scheduler and of the state kept per source and article.
+
+    Real time, unless a replay simulates it: then both time() and
+    monotonic() return the simulated time, which only moves on advance().
+    """
+    simulated = None
+
+    @classmethod
+    def time(cls):
+        return time.time() if cls.simulated is None else cls.simulated
+
+    @classmethod
+    def monotonic(cls):
+        return time.monotonic() if cls.simulated is None else cls.simulated
+
+    @classmethod
+    def simulate(cls, start):
+        """ Freeze time at start (seconds since the epoch). """
+        cls.simulated = start
+
+    @classmethod
+    def advance(cls, seconds):
+        cls.simulated += seconds
@@ -0,0 +1,202 @@
+"""
+This file is part of Security Watch Notifier (sewn.py).
+Copyright (C) 2015 Espen Hovind <espehov@ifi.uio.no>
+
+sewn.py is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+sewn.py is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import collections
+import hashlib
+import itertools
+import random
+import re
+import threading
+import urllib.parse
+from lib.sewn_clock import SEWNClock
+
+class SEWNCluster(object):
+    """
+    Near-duplicate articles across sources.
+
+    Each article gets a MinHash signature over the words of its title. The
+    signature is cut into [cluster] bands of rows hashes, and articles
+    sharing a band are candidates, so a lookup only compares against a few
+    articles however many are indexed. A candidate sharing at least
+    [cluster] similarity of the title words (exact Jaccard), or that has the
+    same canonical link, is a duplicate and joins its cluster. Words with
+    digits (CVE and advisory ids, versions) must be the same in both titles,
+    so DSA-3456-1 never matches DSA-3457-1, and a title naming a CVE never
+    matches one naming none.
+
+    Articles are kept for [cluster] window seconds, and at most
+    max_articles of them.
+    """
+    PRIME = (1 << 61) - 1
+    TOKENS = re.compile(r'[a-z]+-\d+(?:[-:.]\d+)*|\d+(?:\.\d+)+|\w+')
+    STOP_WORDS = frozenset(('a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from',
+                            'has', 'in', 'is', 'it', 'its', 'new', 'of', 'on', 'or', 'the',
+                            'to', 'via', 'was', 'with'))
+    # Query parameters that only track where a click came from
+    TRACKING = re.compile(r'^(utm_\w+|fbclid|gclid|mc_cid|mc_eid|ref|ref_src|source)$')
+    REDIRECT_HOSTS = ('feedproxy.google.com', 'feeds.feedburner.com')
+
+    Article = collections.namedtuple('Article', 'added source title link cluster tokens '
+                                                'bands ids')
+
+    def __init__(self, cfg, logger, fetcher):
+        self.logger = logger
+        self.fetcher = fetcher
+        self.enabled = cfg.getboolean('cluster', 'enabled', fallback=True)
+        self.window = cfg.getint('cluster', 'window', fallback=172800)
+        self.max_articles = cfg.getint('cluster', 'max_articles', fallback=10000)
+        self.bands = cfg.getint('cluster', 'bands', fallback=12)
+        self.rows = cfg.getint('cluster', 'rows', fallback=5)
+        self.similarity = cfg.getfloat('cluster', 'similarity', fallback=0.8)
+        self.resolve_redirects = cfg.getboolean('cluster', 'resolve_redirects', fallback=True)
+
+        # Same permutations every run, so signatures are comparable
+        rng = random.Random(0x5e3)
+        self.permutations = [(rng.randrange(1, self.PRIME), rng.randrange(0, self.PRIME))
+                             for _ in range(self.bands * self.rows)]
+        # id -> Article, oldest first
+        self.articles = collections.OrderedDict()
+        # band -> set(id), canonical link -> id
+        self.buckets = collections.defaultdict(set)
+        self.links = dict()
+        # feedburner link -> article link
+        self.redirects = collections.OrderedDict()
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.duplicates = 0
+
+    def __len__(self):
+        return len(self.articles)
+
+    def tokens(self, title):
+        return {token for token in self.TOKENS.findall(title.casefold())
+                if (len(token) > 1 or token.isdigit()) and token not in self.STOP_WORDS}
+
+    def signature(self, tokens):
+        hashes = [int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(),
+                                 'little') for token in tokens]
+        return tuple(min((a * h + b) % self.PRIME for h in hashes)
+                     for a, b in self.permutations)
+
+    def canonical_link(self, link):
+        """ Link without tracking parameters, fragment, www. and trailing slash. """
+        link = (link or '').strip()
+        if not link:
+            return ''
+        try:
+            url = urllib.parse.urlsplit(link)
+        except ValueError:
+            return link
+        host = url.hostname or ''
+        if host in self.REDIRECT_HOSTS:
+            return self.canonical_link(self.resolve(link)) if self.resolve_redirects else link
+        if host.startswith('www.'):
+            host = host[4:]
+        query = urllib.parse.urlencode(sorted(
+            (key, value) for key, value in urllib.parse.parse_qsl(url.query, keep_blank_values=True)
+            if not self.TRACKING.match(key)))
+        return urllib.parse.urlunsplit(('https' if url.scheme in ('http', 'https') else url.scheme,
+                                        host, url.path.rstrip('/'), query, ''))
+
+    def resolve(self, link):
+        """ Follow a feedburner redirect once and remember where it went. """
+        with self.lock:
+            target = self.redirects.get(link)
+        if target is None:
+            target = self.fetcher.resolve(link)
+            if target is None or urllib.parse.urlsplit(target).hostname in self.REDIRECT_HOSTS:
+                return link
+            with self.lock:
+                self.redirects[link] = target
+                if len(self.redirects) > self.max_articles:
+                    self.redirects.popitem(last=False)
+        return target
+
+    def add(self, source, title, link):
+        """
+        Index an article and return the cluster it belongs to, and the
+        article it duplicates or None.
+        cluster -> tuple(int, tuple(source, title, link))
+        """
+        if not self.enabled:
+            return None, None
+        canonical = self.canonical_link(link)
+        tokens = self.tokens(title)
+        ids = frozenset(token for token in tokens if any(c.isdigit() for c in token))
+        # Too few words to tell a story apart, only the link can match
+        signature = self.signature(tokens) if len(tokens) >= 3 else None
+        bands = list()
+        if signature:
+            bands = [hash((band, signature[band * self.rows:(band + 1) * self.rows]))
+                     for band in range(self.bands)]
+
+        now = SEWNClock.time()
+        with self.lock:
+            self.expire(now)
+            match = self.find(canonical, tokens, bands, ids)
+            article_id = next(self.ids)
+            cluster = match.cluster if match else article_id
+            self.articles[article_id] = self.Article(now, source, title, canonical, cluster,
+                                                     frozenset(tokens), bands, ids)
+            for band in bands:
+                self.buckets[band].add(article_id)
+            if canonical:
+                self.links[canonical] = article_id
+            if match:
+                self.duplicates += 1
+        if match:
+            self.logger.debug("Duplicate: [%s] %s | of [%s] %s",
+                              source, title, match.source, match.title)
+            return cluster, (match.source, match.title, match.link)
+        return cluster, None
+
+    def find(self, canonical, tokens, bands, ids):
+        """ The most similar article indexed, called with the lock held. """
+        article_id = self.links.get(canonical) if canonical else None
+        if article_id in self.articles:
+            return self.articles[article_id]
+        if not bands:
+            return None
+
+        candidates = set()
+        for band in bands:
+            candidates.update(self.buckets.get(band, ()))
+        best, best_score = None, self.similarity
+        for candidate in candidates:
+            article = self.articles[candidate]
+            if ids != article.ids:
+                continue
+            # The signature only finds candidates, the words decide
+            score = len(tokens & article.tokens) / len(tokens | article.tokens)
+            if score >= best_score:
+                best, best_score = article, score
+        return best
+
+    def expire(self, now):
+        """ Drop articles past the window or the size limit, called with the lock held. """
+        while self.articles:
+            article_id, article = next(iter(self.articles.items()))
+            if len(self.articles) < self.max_articles and now - article.added <= self.window:
+                break
+            del self.articles[article_id]
+            for band in article.bands:
+                bucket = self.buckets[band]
+                bucket.discard(article_id)
+                if not bucket:
+                    del self.buckets[band]
+            if article.link and self.links.get(article.link) == article_id:
+                del self.links[article.link]
@@ -0,0 +1,126 @@
+"""
+This file is part of Security Watch Notifier (sewn.py).
+Copyright (C) 2015 Espen Hovind <espehov@ifi.uio.no>
+
+sewn.py is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+sewn.py is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import asyncio
+import signal
+import concurrent.futures
+from lib.sewn_parser import SEWNParser
+
+class SEWNEngine(object):
+    """
+    Drive all sources from a single event loop.
+
+    Waiting between checks is done by the event loop and the shared
+    scheduler, so an idle source costs a heap entry and not an OS thread.
+    The blocking fetch and parse of a source is handed to a worker pool
+    bounded by [engine] concurrency.
+    """
+
+    def __init__(self, cfg, logger, scheduler):
+        self.cfg = cfg
+        self.logger = logger
+        self.scheduler = scheduler
+        self.concurrency = cfg.getint('engine', 'concurrency', fallback=16)
+        self.executor = None
+        self.semaphore = None
+        self.stopped = None
+        self.wakeup = None
+        self.tasks = set()
+
+    def run(self, jobs, func, reload=None):
+        """
+        Poll every job once without notifications (unless warm restarted),
+        then keep polling each job when it is due until SIGINT/SIGTERM.
+        reload is called on SIGHUP, and may change jobs.
+        jobs -> dict(source: tuple(parser, source, feed, keywords, next_check, identify))
+        """
+        asyncio.run(self.main(jobs, func, reload))
+
+    def stop(self):
+        print("sewn.py shutting down..")
+        self.stopped.set()
+        self.wakeup.set()
+
+    def reload(self, reload):
+        reload()
+        self.wakeup.set()
+
+    async def main(self, jobs, func, reload):
+        loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        self.wakeup = asyncio.Event()
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency,
+                                                              thread_name_prefix='sewn')
+        for signo in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signo, self.stop)
+        if reload:
+            loop.add_signal_handler(signal.SIGHUP, self.reload, reload)
+
+        try:
+            # Do first run no-notify to avoid spamming. On a warm restart the
+            # history is already populated, so check every source soon instead.
+            delay = 0
+            if SEWNParser.first_run:
+                await asyncio.gather(*(self.poll(func, job) for job in list(jobs.values())))
+                SEWNParser.first_run = False
+                self.logger.debug("First run done: %d sources", len(jobs))
+                delay = None
+
+            for job in list(jobs.values()):
+                self.scheduler.add(job[1], job[4], delay)
+            await self.dispatch(func, jobs)
+            await asyncio.gather(*self.tasks)
+        finally:
+            self.executor.shutdown(wait=True)
+
+    async def dispatch(self, func, jobs):
+        while not self.stopped.is_set():
+            due = self.scheduler.pop_due()
+            for source, deadline in due:
+                if source not in jobs:
+                    continue
+                task = asyncio.create_task(self.poll_scheduled(func, jobs[source]))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+            if due:
+                self.logger.debug("Dispatched %d due sources", len(due))
+
+            self.wakeup.clear()
+            try:
+                # Sleep until the next deadline, a reschedule or shutdown.
+                await asyncio.wait_for(self.wakeup.wait(), self.scheduler.next_delay())
+            except asyncio.TimeoutError:
+                pass
+
+    async def poll_scheduled(self, func, job):
+        try:
+            await self.poll(func, job)
+        finally:
+            self.scheduler.reschedule(job[1])
+            self.wakeup.set()
+
+    async def poll(self, func, job):
+        async with self.semaphore:
+            if self.stopped.is_set():
+                return
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(self.executor, func, *job)
+            except Exception:
+                # One broken source must not stop the others
+                self.logger.exception("Failed checking source: %s", job[1])
@@ -18,5 +18,12 @@ along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
 class ArticleParseFailed(Exception):
     """ Raise an exception when fail parsing articles """
     def __init__(self, source, message):
+        super().__init__(source, message)
         self.source = source
         self.message = message
+
+class FeedNotModified(Exception):
+    """ Raise an exception when a feed is unchanged since the last check """
+    def __init__(self, feed):
+        super().__init__(feed)
+        self.feed = feed
@@ -0,0 +1,245 @@
+"""
+This file is part of Security Watch Notifier (sewn.py).
+Copyright (C) 2015 Espen Hovind <espehov@ifi.uio.no>
+
+sewn.py is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+sewn.py is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import collections
+import email.utils
+import importlib.util
+import re
+import threading
+import time
+from lib.sewn_clock import SEWNClock
+import lib.sewn_exceptions as SEWNExceptions
+
+class SEWNFetcher(object):
+    """
+    Fetch layer shared by all parsers.
+
+    Remembers the ETag/Last-Modified validators of every feed and sends them
+    back as a conditional GET, so an unchanged feed costs a 304 and no parse.
+    All requests go through one session with a keep-alive connection pool
+    per host, so sources on the same host share connections.
+    """
+
+    def __init__(self, cfg, logger):
+        self.cfg = cfg
+        self.logger = logger
+        self.validators = dict()
+        self.hints = collections.defaultdict(dict)
+        self.stats = collections.Counter()
+        self.lock = threading.Lock()
+        # Duration and size of the last fetch of the calling thread
+        self.local = threading.local()
+        self.timeout = (cfg.getfloat('http', 'connect_timeout', fallback=10),
+                        cfg.getfloat('http', 'read_timeout', fallback=30))
+        encodings = ['gzip', 'deflate']
+        if importlib.util.find_spec('brotli'):
+            encodings.append('br')
+        self.accept_encoding = ', '.join(encodings)
+        # Created on first fetch, importing requests is slow
+        self.session = None
+        # SEWNRecorder saving every response, see --record
+        self.recorder = None
+
+    def get_session(self):
+        with self.lock:
+            if self.session is None:
+                self.session = self.init_session()
+            return self.session
+
+    def init_session(self):
+        import requests
+        import requests.adapters
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=self.cfg.getint('http', 'pool_hosts', fallback=32),
+            pool_maxsize=self.cfg.getint('http', 'pool_maxsize', fallback=4))
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        # requests decodes gzip/deflate, and br when brotli is installed
+        session.headers['Accept-Encoding'] = self.accept_encoding
+        return session
+
+    def fetch(self, feed, headers=None):
+        """
+        Return the decoded body of feed.
+        Raise FeedNotModified on 304 and IOError on failure.
+        """
+        start = time.perf_counter()
+        response = self.request(feed, headers)
+        body = response.content
+        # Count bytes on the wire, before content decoding
+        size = response.raw.tell()
+        self.count(modified=1, bytes=size)
+        self.local.last = (time.perf_counter() - start, size)
+        if self.recorder:
+            self.recorder.record(feed, response.status_code, response.headers, body, size)
+        return body
+
+    def fetch_stream(self, feed, headers=None, chunk_size=16384):
+        """
+        Yield the decoded body of feed in chunks as it arrives. Closing the
+        generator early drops the rest of the response.
+        Raise FeedNotModified on 304 and IOError on failure.
+        """
+        start = time.perf_counter()
+        response = self.request(feed, headers, stream=True)
+        chunks = list() if self.recorder else None
+        try:
+            for chunk in response.iter_content(chunk_size):
+                if chunks is not None:
+                    chunks.append(chunk)
+                yield chunk
+        except GeneratorExit:
+            # Stopped early, a recording still needs the whole feed
+            if chunks is not None:
+                chunks.extend(response.iter_content(chunk_size))
+            raise
+        except IOError as err:
+            if chunks is not None:
+                self.recorder.record(feed, None, None, error=str(err))
+                chunks = None
+            raise
+        finally:
+            size = response.raw.tell()
+            self.count(modified=1, bytes=size)
+            # Includes the time spent parsing between chunks
+            self.local.last = (time.perf_counter() - start, size)
+            response.close()
+            if chunks is not None:
+                self.recorder.record(feed, response.status_code, response.headers,
+                                     b''.join(chunks), size)
+
+    def request(self, feed, headers, stream=False):
+        headers = dict(headers or {})
+        with self.lock:
+            etag, modified = self.validators.get(feed, (None, None))
+        if etag:
+            headers['If-None-Match'] = etag
+        if modified:
+            headers['If-Modified-Since'] = modified
+
+        try:
+            response = self.get_session().get(feed, headers=headers, timeout=self.timeout,
+                                              stream=stream)
+        except IOError as err:
+            if self.recorder:
+                self.recorder.record(feed, None, None, error=str(err))
+            raise
+        self.record_hints(feed, response.headers)
+        if self.recorder and (response.status_code == 304 or not response.ok):
+            self.recorder.record(feed, response.status_code, response.headers)
+        if response.status_code == 304:
+            response.close()
+            self.count(not_modified=1)
+            raise SEWNExceptions.FeedNotModified(feed)
+        if not response.ok:
+            response.close()
+            response.raise_for_status()
+        self.logger.debug("feed: %s | headers: %s", feed, response.headers)
+
+        with self.lock:
+            self.validators[feed] = (response.headers.get('ETag'),
+                                     response.headers.get('Last-Modified'))
+        return response
+
+    def resolve(self, link):
+        """ Return where link redirects to, or None on failure. """
+        try:
+            response = self.get_session().head(link, allow_redirects=True, timeout=self.timeout)
+            response.close()
+        except IOError as err:
+            self.logger.debug("Failed resolving link: %s (%s)", link, err)
+            return None
+        if self.recorder:
+            self.recorder.record_resolve(link, response.url)
+        return response.url
+
+    def record_hints(self, feed, headers):
+        """ Remember how long the server asks us to wait before polling again. """
+        hints = dict()
+        max_age = re.search(r'max-age=(\d+)', headers.get('Cache-Control', ''))
+        if max_age:
+            hints['max_age'] = int(max_age.group(1))
+        retry_after = headers.get('Retry-After')
+        if retry_after:
+            if retry_after.isdigit():
+                hints['retry_after'] = int(retry_after)
+            else:
+                try:
+                    date = email.utils.parsedate_to_datetime(retry_after)
+                    hints['retry_after'] = max(0, int(date.timestamp() - SEWNClock.time()))
+                except (TypeError, ValueError):
+                    pass
+        with self.lock:
+            # Header hints only last until the next response
+            self.hints[feed].pop('max_age', None)
+            self.hints[feed].pop('retry_after', None)
+            self.hints[feed].update(hints)
+
+    def set_hint(self, feed, name, seconds):
+        """ Hints found in the feed itself, e.g. RSS ttl. """
+        with self.lock:
+            self.hints[feed][name] = seconds
+
+    def min_interval(self, feed):
+        """ Shortest poll interval the server and feed hints allow. """
+        with self.lock:
+            return max(self.hints[feed].values(), default=0)
+
+    def last_fetch(self):
+        """
+        Duration and size of the last fetch done by this thread, then reset.
+        fetch -> tuple(seconds, bytes)
+        """
+        last = getattr(self.local, 'last', (0.0, 0))
+        self.local.last = (0.0, 0)
+        return last
+
+    def count(self, **counters):
+        with self.lock:
+            self.stats.update(counters)
+
+    def hit_ratio(self):
+        """ Share of fetches answered with 304 Not Modified. """
+        with self.lock:
+            total = self.stats['modified'] + self.stats['not_modified']
+            return self.stats['not_modified'] / total if total else 0.0
+
+    def pool_stats(self):
+        """
+        Connection reuse per host.
+        stats -> dict(host: tuple(connections, requests))
+        """
+        stats = dict()
+        if self.session is None:
+            return stats
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    stats[pool.host] = (pool.num_connections, pool.num_requests)
+        return stats
+
+    def close(self):
+        for host, (connections, requests_sent) in self.pool_stats().items():
+            self.logger.info("Pool: %s | connections: %d | requests: %d",
+                             host, connections, requests_sent)
+        if self.session is not None:
+            self.session.close()
+        if self.recorder:
+            self.recorder.close()
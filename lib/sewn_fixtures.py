@@ -0,0 +1,117 @@
+"""
+This file is part of Security Watch Notifier (sewn.py).
+Copyright (C) 2015 Espen Hovind <espehov@ifi.uio.no>
+
+sewn.py is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+sewn.py is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import http.server
+import json
+import threading
+from xml.sax.saxutils import escape
+
+WORDS = ('OpenSSH', 'OpenSSL', 'kernel', 'privilege', 'escalation', 'remote', 'code',
+         'execution', 'CVE-2015-0235', 'glibc', 'overflow', 'patch', 'advisory', 'TLS')
+
+def title(n):
+    return ' '.join(WORDS[(n * 7 + i) % len(WORDS)] for i in range(8)) + ' #%d' % n
+
+def rss(items):
+    entries = ''.join('<item><title>%s</title><link>http://bench.local/rss/%d</link>'
+                      '<description>%s</description></item>' %
+                      (escape(title(n)), n, escape(title(n) * 4)) for n in range(items))
+    return ('<?xml version="1.0"?><rss version="2.0"><channel><title>bench</title>'
+            '<link>http://bench.local/</link>%s</channel></rss>' % entries).encode('utf-8')
+
+def atom(items):
+    entries = ''.join('<entry><title>%s</title><link rel="alternate" '
+                      'href="http://bench.local/atom/%d"/><summary>%s</summary></entry>' %
+                      (escape(title(n)), n, escape(title(n) * 4)) for n in range(items))
+    return ('<?xml version="1.0"?><feed xmlns="http://www.w3.org/2005/Atom">'
+            '<title>bench</title>%s</feed>' % entries).encode('utf-8')
+
+def gmane(items):
+    entries = ''.join('<item rdf:about="http://bench.local/gmane/%d"><title>%s</title>'
+                      '<link>http://bench.local/gmane/%d</link><description>%s</description>'
+                      '</item>' % (n, escape(title(n)), n, escape(title(n) * 4))
+                      for n in range(items))
+    return ('<?xml version="1.0"?><rdf:RDF '
+            'xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" '
+            'xmlns="http://purl.org/rss/1.0/"><channel><title>bench</title></channel>'
+            '%s</rdf:RDF>' % entries).encode('utf-8')
+
+def xml(items):
+    """ StackExchange style Atom, one <link> per entry. """
+    entries = ''.join('<entry><id>http://bench.local/xml/%d</id><title type="text">%s</title>'
+                      '<link rel="alternate" href="http://bench.local/xml/%d"/>'
+                      '<summary type="html">%s</summary></entry>' %
+                      (n, escape(title(n)), n, escape(title(n) * 4)) for n in range(items))
+    return ('<?xml version="1.0" encoding="utf-8"?><feed xmlns="http://www.w3.org/2005/Atom">'
+            '<title type="text">bench</title>%s</feed>' % entries).encode('utf-8')
+
+def reddit(items):
+    children = [{'kind': 't3', 'data': {'title': title(n), 'permalink': '/r/bench/%d' % n,
+                                        'selftext': title(n) * 4}} for n in range(items)]
+    return json.dumps({'kind': 'Listing', 'data': {'children': children}}).encode('utf-8')
+
+# type -> tuple(generator, content type)
+FEEDS = {'rss': (rss, 'application/rss+xml'),
+         'atom': (atom, 'application/atom+xml'),
+         'gmane': (gmane, 'application/rdf+xml'),
+         'xml': (xml, 'application/atom+xml'),
+         'reddit': (reddit, 'application/json')}
+
+
+class SEWNFixtureServer(object):
+    """
+    Local HTTP stand-in serving in-memory documents.
+    documents -> dict(path: tuple(body, content type))
+    """
+
+    def __init__(self, documents):
+        self.documents = documents
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                try:
+                    body, content_type = server.documents[self.path]
+                except KeyError:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def url(self, path):
+        return 'http://127.0.0.1:%d%s' % (self.httpd.server_port, path)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
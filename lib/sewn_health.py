@@ -0,0 +1,156 @@
+"""
+This file is part of Security Watch Notifier (sewn.py).
+Copyright (C) 2015 Espen Hovind <espehov@ifi.uio.no>
+
+sewn.py is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+sewn.py is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import json
+import os
+import random
+import threading
+from lib.sewn_clock import SEWNClock
+
+class SEWNHealth(object):
+    """
+    Per-source health and circuit breaker.
+
+    A failed check is retried after the check interval doubled for every
+    failure in a row, up to [health] max_backoff, with jitter. After
+    [health] failures in a row the circuit of the source opens: checks are
+    skipped until the backoff has passed, and the next one is a half-open
+    probe that closes the circuit on success or opens it again on failure.
+    State is saved to [health] path so a restart does not retry dead feeds.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, cfg, logger, scheduler, metrics):
+        self.logger = logger
+        self.scheduler = scheduler
+        self.metrics = metrics
+        self.threshold = cfg.getint('health', 'failures', fallback=5)
+        self.max_backoff = cfg.getint('health', 'max_backoff', fallback=21600)
+        self.jitter = cfg.getfloat('health', 'jitter', fallback=0.5)
+        self.path = cfg.get('health', 'path', fallback=None)
+
+        # source -> dict(state, failures, retry_at, error), retry_at is wall time
+        self.state = dict()
+        self.lock = threading.Lock()
+        if self.path:
+            self.load()
+
+    def allow(self, source):
+        """
+        Whether source may be checked now. A skipped source is deferred to
+        the end of its backoff. Sources are popped up to the scheduler batch
+        window early, so a retry within the window is allowed, otherwise it
+        would be deferred into the window and popped again at once.
+        """
+        now = SEWNClock.time()
+        with self.lock:
+            state = self.state.get(source)
+            if state is None:
+                return True
+            if now < state['retry_at'] - self.scheduler.batch_window:
+                remaining = state['retry_at'] - now
+            else:
+                if state['state'] == self.OPEN:
+                    state['state'] = self.HALF_OPEN
+                    self.logger.info("Circuit half-open: %s | probing", source)
+                return True
+
+        self.logger.debug("Skipped: %s | %s | retry in %ds", source, state['state'], remaining)
+        self.metrics.inc('sewn_checks_skipped_total', source=source)
+        self.scheduler.defer(source, remaining)
+        return False
+
+    def success(self, source):
+        with self.lock:
+            state = self.state.pop(source, None)
+            if state is None:
+                return
+            self.save()
+        if state['state'] != self.CLOSED:
+            self.logger.warning("Circuit closed: %s | recovered after %d failures",
+                                source, state['failures'])
+
+    def failure(self, source, interval, error):
+        """ Record a failed check and defer the next check of source. """
+        with self.lock:
+            state = self.state.setdefault(source, {'state': self.CLOSED, 'failures': 0,
+                                                   'retry_at': 0, 'error': None})
+            state['failures'] += 1
+            state['error'] = str(error)
+            backoff = min(interval * 2 ** (state['failures'] - 1), self.max_backoff)
+            delay = backoff * random.uniform(1 - self.jitter, 1)
+            state['retry_at'] = SEWNClock.time() + delay
+
+            previous = state['state']
+            if previous == self.HALF_OPEN or state['failures'] >= self.threshold:
+                state['state'] = self.OPEN
+            self.save()
+
+        if state['state'] == self.OPEN and previous == self.CLOSED:
+            self.logger.warning("Circuit open: %s | %d failures in a row | retry in %ds",
+                                source, state['failures'], delay)
+            self.metrics.inc('sewn_circuit_opened_total', source=source)
+        elif previous == self.HALF_OPEN:
+            self.logger.info("Circuit open: %s | probe failed | retry in %ds", source, delay)
+        else:
+            self.logger.debug("Backoff: %s | %d failures in a row | retry in %ds",
+                              source, state['failures'], delay)
+        self.scheduler.defer(source, delay)
+
+    def count(self, states):
+        with self.lock:
+            return sum(1 for state in self.state.values() if state['state'] in states)
+
+    def open_count(self):
+        return self.count((self.OPEN, self.HALF_OPEN))
+
+    def failing_count(self):
+        return self.count((self.CLOSED,))
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                self.state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as err:
+            self.logger.error("Failed loading health: %s (%s)", self.path, err)
+            return
+        opened = [source for source, state in self.state.items() if state['state'] != self.CLOSED]
+        if opened:
+            self.logger.info("Circuits open: %s", ', '.join(sorted(opened)))
+
+    def save(self):
+        """ Replace the state file, called with the lock held. """
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump(self.state, f, indent=1, sort_keys=True)
+            os.replace(self.path + '.tmp', self.path)
+        except OSError as err:
+            self.logger.error("Failed saving health: %s (%s)", self.path, err)
+
+    def log_report(self):
+        with self.lock:
+            for source, state in sorted(self.state.items()):
+                self.logger.info("Health: %s | %s | %d failures | %s", source,
+                                 state['state'], state['failures'], state['error'])
@@ -0,0 +1,190 @@
+"""
+This file is part of Security Watch Notifier (sewn.py).
+Copyright (C) 2015 Espen Hovind <espehov@ifi.uio.no>
+
+sewn.py is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+sewn.py is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import collections
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from lib.sewn_clock import SEWNClock
+
+class SEWNHistory(object):
+    """
+    Index of seen articles.
+
+    Articles are keyed by a digest of (source, link, normalized title), and
+    kept in LRU order with a timestamp so lookups are O(1) and eviction by
+    size or age only ever touches the oldest end.
+
+    If [history] path is set, every added article is appended to a log of
+    fixed size records (digest, timestamp), which is replayed at startup and
+    compacted when it grows past twice the live index. The timestamp of an
+    article still in its feed is refreshed, and appended again, at most once
+    per REFRESH of the age limit, so the log keeps up with the index and the
+    article outlives a restart. The names of sources checked at least once
+    are kept next to the log, so a warm restart can tell sources added while
+    stopped.
+    """
+    RECORD = struct.Struct('<16sd')
+    # Share of the age limit a timestamp may lag behind on disk
+    REFRESH = 0.1
+
+    def __init__(self, cfg, logger):
+        self.logger = logger
+        self.max_articles = cfg.getint('history', 'max_articles', fallback=10000)
+        self.ttl = cfg.getint('history', 'ttl', fallback=0)
+        self.path = cfg.get('history', 'path', fallback=None)
+        # Seconds before a refreshed timestamp is written, a day without age limit
+        self.refresh = self.ttl * self.REFRESH if self.ttl else 86400
+
+        self.index = collections.OrderedDict()
+        # Sources checked at least once, None if the log predates this list
+        self.sources = set()
+        self.lock = threading.Lock()
+        self.fd = None
+        self.records = 0
+        self.lookups = 0
+        self.hits = 0
+        if self.path:
+            self.load()
+
+    def __len__(self):
+        return len(self.index)
+
+    @staticmethod
+    def key(source, title, link):
+        normalized = ' '.join(title.casefold().split())
+        data = '\x1f'.join((source, (link or '').strip(), normalized))
+        return hashlib.blake2b(data.encode('utf-8'), digest_size=16).digest()
+
+    def is_new(self, source, title, link):
+        """ Check if article is never before seen. """
+        with self.lock:
+            return self.lookup(self.key(source, title, link), SEWNClock.time())
+
+    def filter_new(self, articles):
+        """
+        Return the never before seen articles of a batch.
+        articles -> list(tuple(source, title, link))
+        """
+        now = SEWNClock.time()
+        with self.lock:
+            new_articles = [art for art in articles if self.lookup(self.key(*art), now)]
+            self.lookups += len(articles)
+            self.hits += len(articles) - len(new_articles)
+        return new_articles
+
+    def hit_ratio(self):
+        """ Share of filtered articles that were already seen. """
+        with self.lock:
+            return self.hits / self.lookups if self.lookups else 0.0
+
+    def add(self, source, title, link):
+        key = self.key(source, title, link)
+        now = SEWNClock.time()
+        with self.lock:
+            self.insert(key, now)
+            self.write(key, now)
+
+    def write(self, key, now):
+        """ Append a record to the log, called with the lock held. """
+        if self.fd is None:
+            return
+        os.write(self.fd, self.RECORD.pack(key, now))
+        self.records += 1
+        if self.records > 2 * max(len(self.index), 1024):
+            self.compact()
+
+    def load(self):
+        """ Replay the on-disk log into the index. """
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o600)
+        size = os.fstat(self.fd).st_size
+        # Ignore a trailing partial record from an interrupted write
+        size -= size % self.RECORD.size
+        if size:
+            with mmap.mmap(self.fd, size, access=mmap.ACCESS_READ) as data:
+                for key, timestamp in self.RECORD.iter_unpack(data):
+                    self.index[key] = timestamp
+                    self.index.move_to_end(key)
+            self.records = size // self.RECORD.size
+            self.evict(SEWNClock.time())
+        try:
+            with open(self.path + '.sources', 'r') as f:
+                self.sources = set(line.rstrip('\n') for line in f)
+        except FileNotFoundError:
+            self.sources = None if self.index else set()
+        self.logger.info("Loaded history: %s (%d articles)", self.path, len(self.index))
+
+    def is_checked(self, source):
+        """ Whether source was checked before, always True for an older log. """
+        return self.sources is None or source in self.sources
+
+    def checked(self, source):
+        """ Remember that source has been checked once. """
+        if self.sources is not None and source in self.sources:
+            return
+        with self.lock:
+            if self.sources is None:
+                self.sources = set()
+            self.sources.add(source)
+            if self.fd is not None:
+                with open(self.path + '.sources', 'a') as f:
+                    f.write(source + '\n')
+
+    def compact(self):
+        """ Rewrite the log with only the live index, then swap it in. """
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(b''.join(self.RECORD.pack(key, timestamp)
+                             for key, timestamp in self.index.items()))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        os.close(self.fd)
+        self.fd = os.open(self.path, os.O_RDWR | os.O_APPEND)
+        self.records = len(self.index)
+        self.logger.debug("Compacted history: %s (%d articles)", self.path, self.records)
+
+    def close(self):
+        with self.lock:
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
+
+    def lookup(self, key, now):
+        """ Return True if key is unseen, refresh it if due otherwise. """
+        if key not in self.index:
+            return True
+        if now - self.index[key] >= self.refresh:
+            self.index[key] = now
+            self.index.move_to_end(key)
+            self.write(key, now)
+        return False
+
+    def insert(self, key, now):
+        self.index[key] = now
+        self.index.move_to_end(key)
+        self.evict(now)
+
+    def evict(self, now):
+        while len(self.index) > self.max_articles:
+            self.index.popitem(last=False)
+        if self.ttl:
+            while self.index and now - next(iter(self.index.values())) > self.ttl:
+                self.index.popitem(last=False)
@@ -0,0 +1,110 @@
+"""
+This file is part of Security Watch Notifier (sewn.py).
+Copyright (C) 2015 Espen Hovind <espehov@ifi.uio.no>
+
+sewn.py is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+sewn.py is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import atexit
+import contextlib
+import contextvars
+import datetime
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+
+class SEWNLogging(object):
+    """
+    Non-blocking log pipeline.
+
+    The handlers configured in config/sewn-log.ini are moved behind a
+    queue: a logging call only puts the record on the queue, and a listener
+    thread formats and writes it, so log I/O and rotation stay off the fetch
+    and notify paths. Records logged during a check carry its source and a
+    fetch id, written by SEWNJSONFormatter for correlation.
+    """
+    source = contextvars.ContextVar('source', default=None)
+    fetch = contextvars.ContextVar('fetch', default=None)
+    fetches = itertools.count(1)
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.handlers = list(logger.handlers)
+        self.handler = SEWNQueueHandler(queue.SimpleQueue())
+        self.handler.addFilter(self.correlate)
+        for handler in self.handlers:
+            logger.removeHandler(handler)
+        logger.addHandler(self.handler)
+        self.listener = logging.handlers.QueueListener(self.handler.queue, *self.handlers,
+                                                       respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.close)
+
+    @classmethod
+    @contextlib.contextmanager
+    def context(cls, source):
+        """ Tag what is logged in this block with source and a new fetch id. """
+        source_token = cls.source.set(source)
+        fetch_token = cls.fetch.set(next(cls.fetches))
+        try:
+            yield
+        finally:
+            cls.fetch.reset(fetch_token)
+            cls.source.reset(source_token)
+
+    @classmethod
+    def correlate(cls, record):
+        # Runs in the thread that logs, where the context of the check is set
+        record.source = cls.source.get()
+        record.fetch = cls.fetch.get()
+        return True
+
+    def close(self):
+        """ Write what is queued, then log directly to the handlers again. """
+        if self.listener is None:
+            return
+        self.listener.stop()
+        self.listener = None
+        self.logger.removeHandler(self.handler)
+        for handler in self.handlers:
+            self.logger.addHandler(handler)
+
+
+class SEWNQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler leaving the formatting to the listener thread. The queue is
+    in-process, so records need not be made picklable, and arguments must
+    not be changed after they are logged.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class SEWNJSONFormatter(logging.Formatter):
+    """ One JSON object per line, with the source and fetch id of the check. """
+
+    def format(self, record):
+        entry = {'time': datetime.datetime.fromtimestamp(record.created).astimezone()
+                 .isoformat(timespec='milliseconds'),
+                 'level': record.levelname,
+                 'message': record.getMessage(),
+                 'thread': record.threadName}
+        if getattr(record, 'source', None) is not None:
+            entry['source'] = record.source
+            entry['fetch'] = record.fetch
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
@@ -0,0 +1,113 @@
+"""
+This file is part of Security Watch Notifier (sewn.py).
+Copyright (C) 2015 Espen Hovind <espehov@ifi.uio.no>
+
+sewn.py is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+sewn.py is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import threading
+from lib.sewn_history import SEWNHistory
+
+class SEWNMarks(object):
+    """
+    Per-source high-water marks for incremental parsing.
+
+    The mark of a source is its first item (link and title) at the last
+    check. Once a source is known to list the newest items first, a check
+    stops at the mark, since everything after it has been seen.
+
+    Order is learned from full scans: a scan where new items were found
+    and all of them came before the old mark counts as evidence, a new item
+    after the mark means the feed is unordered. Incremental mode starts
+    after [parser] verify scans of evidence, and every full_scan checks a
+    full scan is done again to keep verifying. It is off by default, since
+    rank-ordered feeds can pass the checks and still drop items.
+    """
+
+    def __init__(self, cfg, logger, history):
+        self.logger = logger
+        self.history = history
+        self.enabled = history is not None and cfg.getboolean('parser', 'incremental',
+                                                              fallback=False)
+        self.verify = cfg.getint('parser', 'verify', fallback=5)
+        self.full_scan = max(1, cfg.getint('parser', 'full_scan', fallback=20))
+
+        # source -> dict(mark, ordered, checks)
+        self.state = dict()
+        self.lock = threading.Lock()
+
+    def scan(self, source):
+        """ Start a check of source, None if marks are disabled. """
+        if not self.enabled:
+            return None
+        with self.lock:
+            state = self.state.setdefault(source, {'mark': None, 'ordered': 0, 'checks': 0})
+            state['checks'] += 1
+            incremental = (state['mark'] is not None and state['ordered'] >= self.verify
+                           and state['checks'] % self.full_scan != 0)
+            return SEWNScan(self, source, state['mark'], incremental)
+
+    def finish(self, scan):
+        """ Update the mark and order evidence of a source after a check. """
+        with self.lock:
+            state = self.state[scan.source]
+            if scan.first is not None:
+                state['mark'] = scan.first
+            if scan.incremental or scan.mark_position is None or not scan.new_positions:
+                return
+            previous = state['ordered']
+            if max(scan.new_positions) < scan.mark_position:
+                state['ordered'] += 1
+            else:
+                state['ordered'] = 0
+        if state['ordered'] == self.verify:
+            self.logger.debug("Incremental: %s | newest first, stopping at the mark", scan.source)
+        elif previous >= self.verify and not state['ordered']:
+            self.logger.debug("Incremental: %s | not ordered, full scans", scan.source)
+
+
+class SEWNScan(object):
+    """ One check of a source, fed every item in document order. """
+
+    def __init__(self, marks, source, mark, incremental):
+        self.marks = marks
+        self.source = source
+        self.mark = mark
+        self.incremental = incremental
+        self.position = 0
+        self.first = None
+        self.mark_position = None
+        self.new_positions = list()
+
+    def stop(self, title, link, wanted=True):
+        """
+        True when the item is the mark of an incremental check. Items not
+        wanted (keywords) never reach the history, so they say nothing
+        about order.
+        """
+        key = SEWNHistory.key(self.source, title or '', link or '')
+        if self.first is None:
+            self.first = key
+        if key == self.mark:
+            if self.incremental:
+                return True
+            if self.mark_position is None:
+                self.mark_position = self.position
+        elif (wanted and not self.incremental
+              and self.marks.history.is_new(self.source, title or '', link)):
+            self.new_positions.append(self.position)
+        self.position += 1
+        return False
+
+    def finish(self):
+        self.marks.finish(self)
@@ -0,0 +1,69 @@
+"""
+This file is part of Security Watch Notifier (sewn.py).
+Copyright (C) 2015 Espen Hovind <espehov@ifi.uio.no>
+
+sewn.py is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+sewn.py is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import re
+
+class SEWNMatcher(object):
+    """
+    Case-insensitive substring matcher for a list of keywords.
+
+    All keywords are compiled into one regex alternation, so a title is
+    casefolded once and scanned once no matter how many keywords there are.
+    """
+
+    def __init__(self, keywords):
+        self.keywords = dict()
+        for keyword in keywords or ():
+            keyword = keyword.strip()
+            if keyword:
+                self.keywords.setdefault(keyword.casefold(), keyword)
+
+        # Longest first, so the longest keyword starting at a position wins.
+        # The lookahead makes matches overlap, e.g. both 'openssh' and 'ssh'.
+        alternation = '|'.join(re.escape(keyword) for keyword in
+                               sorted(self.keywords, key=len, reverse=True))
+        self.pattern = re.compile('(?=(%s))' % alternation) if self.keywords else None
+        # Shorter keywords starting at the same position are prefixes of the
+        # one matched, e.g. 'openssl' of 'openssl 1.0.2'
+        self.prefixes = {keyword: [other for other in self.keywords
+                                   if other != keyword and keyword.startswith(other)]
+                         for keyword in self.keywords}
+
+    def __bool__(self):
+        return self.pattern is not None
+
+    def __iter__(self):
+        return iter(self.keywords.values())
+
+    @classmethod
+    def from_string(cls, keywords):
+        """ Build from a comma separated config value. """
+        return cls(keywords.split(',') if keywords else None)
+
+    def search(self, title):
+        """ Return True if any keyword is in title. """
+        return bool(self.pattern and self.pattern.search(title.casefold()))
+
+    def match(self, title):
+        """ Return the set of keywords in title, as spelled in the config. """
+        if not self.pattern:
+            return set()
+        matched = set()
+        for m in self.pattern.finditer(title.casefold()):
+            matched.add(self.keywords[m.group(1)])
+            matched.update(self.keywords[prefix] for prefix in self.prefixes[m.group(1)])
+        return matched
@@ -0,0 +1,148 @@
+"""
+This file is part of Security Watch Notifier (sewn.py).
+Copyright (C) 2015 Espen Hovind <espehov@ifi.uio.no>
+
+sewn.py is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+sewn.py is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import collections
+import threading
+
+class SEWNMetrics(object):
+    """
+    In-process metrics, served in the Prometheus text format.
+
+    Counters and summaries are updated on the hot path under one lock.
+    Gauges are callbacks evaluated when the endpoint is scraped.
+    """
+
+    def __init__(self, cfg, logger):
+        self.logger = logger
+        self.host = cfg.get('metrics', 'host', fallback='127.0.0.1')
+        self.port = cfg.getint('metrics', 'port', fallback=0)
+
+        self.help = dict()
+        self.types = dict()
+        # name -> dict(labels: value), labels -> tuple(tuple(key, value))
+        self.counters = collections.defaultdict(collections.Counter)
+        # name -> dict(labels: list(count, sum, max))
+        self.summaries = collections.defaultdict(dict)
+        # name -> list(tuple(labels, func))
+        self.gauges = collections.defaultdict(list)
+        self.lock = threading.Lock()
+        self.httpd = None
+
+    def describe(self, name, kind, text):
+        self.types[name] = kind
+        self.help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        with self.lock:
+            self.counters[name][tuple(sorted(labels.items()))] += value
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            summary = self.summaries[name].get(key)
+            if summary is None:
+                self.summaries[name][key] = [1, value, value]
+            else:
+                summary[0] += 1
+                summary[1] += value
+                summary[2] = max(summary[2], value)
+
+    def total(self, name):
+        """ Sum of a counter, or of the observations of a summary, over all labels. """
+        with self.lock:
+            if name in self.summaries:
+                return sum(summary[1] for summary in self.summaries[name].values())
+            return sum(self.counters[name].values()) if name in self.counters else 0
+
+    def gauge(self, name, func, **labels):
+        """ Register a callback returning the current value of a gauge. """
+        self.gauges[name].append((tuple(sorted(labels.items())), func))
+
+    def render(self):
+        lines = list()
+        with self.lock:
+            counters = {name: dict(values) for name, values in self.counters.items()}
+            summaries = {name: {key: list(value) for key, value in values.items()}
+                         for name, values in self.summaries.items()}
+
+        for name in sorted(counters):
+            self.header(lines, name, 'counter')
+            for labels, value in sorted(counters[name].items()):
+                lines.append('%s%s %s' % (name, self.labels(labels), value))
+        for name in sorted(summaries):
+            self.header(lines, name, 'summary')
+            for labels, (count, total, maximum) in sorted(summaries[name].items()):
+                lines.append('%s_count%s %d' % (name, self.labels(labels), count))
+                lines.append('%s_sum%s %f' % (name, self.labels(labels), total))
+                lines.append('%s_max%s %f' % (name, self.labels(labels), maximum))
+        for name in sorted(self.gauges):
+            self.header(lines, name, 'gauge')
+            for labels, func in self.gauges[name]:
+                try:
+                    lines.append('%s%s %s' % (name, self.labels(labels), func()))
+                except Exception as err:
+                    self.logger.error("Failed reading gauge: %s (%s)", name, err)
+        return '\n'.join(lines) + '\n'
+
+    def header(self, lines, name, kind):
+        if name in self.help:
+            lines.append('# HELP %s %s' % (name, self.help[name]))
+        lines.append('# TYPE %s %s' % (name, self.types.get(name, kind)))
+
+    @staticmethod
+    def labels(labels):
+        if not labels:
+            return ''
+        return '{%s}' % ','.join('%s="%s"' % (key, str(value).replace('\\', '\\\\')
+                                              .replace('"', '\\"').replace('\n', '\\n'))
+                                 for key, value in labels)
+
+    def start(self):
+        """ Serve /metrics on [metrics] host:port, if a port is configured. """
+        if not self.port:
+            return
+        import http.server
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            self.httpd = http.server.ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as err:
+            self.logger.error("Failed starting metrics endpoint: %s", err)
+            return
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, name='metrics', daemon=True).start()
+        self.logger.info("Metrics: http://%s:%d/metrics", self.host, self.port)
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
@@ -0,0 +1,254 @@
+"""
+This file is part of Security Watch Notifier (sewn.py).
+Copyright (C) 2015 Espen Hovind <espehov@ifi.uio.no>
+
+sewn.py is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+sewn.py is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import collections
+import queue
+import threading
+import time
+from lib.sewn_matcher import SEWNMatcher
+
+class SEWNNotifier(object):
+    """
+    Notification dispatcher.
+
+    Articles are queued by the fetchers and sent to D-Bus from a dedicated
+    thread, throttled by [dbus] delay. dbus and jinja2 are imported by that
+    thread, off the startup path. Articles arriving within
+    [notifier] coalesce_window are grouped by source, and a source with at
+    least coalesce_min articles gets one summary notification.
+
+    Near-duplicates from several sources (same cluster) within the window
+    become one notification naming the other sources. A later article of a
+    story already notified is suppressed, and counted as a duplicate.
+    Articles naming a watched advisory id or an ack keyword are critical,
+    and never grouped, merged or suppressed.
+    """
+    # Clusters already notified to remember
+    NOTIFIED = 10000
+
+    def __init__(self, cfg, logger, templates):
+        self.cfg = cfg
+        self.logger = logger
+        self.templates = templates
+        self.ack_keywords = SEWNMatcher.from_string(cfg.get('main', 'ack_keywords'))
+        self.delay = cfg.getint('dbus', 'delay')
+        self.window = cfg.getfloat('notifier', 'coalesce_window', fallback=5)
+        self.coalesce_min = cfg.getint('notifier', 'coalesce_min', fallback=3)
+
+        self.queue = queue.Queue()
+        self.notified = collections.OrderedDict()
+        self.stats = collections.Counter()
+        self.lock = threading.Lock()
+        self.interface = None
+        self.thread = threading.Thread(target=self.dispatch, name='notifier', daemon=True)
+
+    def init_notifier(self):
+        try:
+            import dbus
+        except ImportError as err:
+            self.logger.error("Failed dbus setup: %s", err)
+            return None
+        try:
+            bus = dbus.SessionBus()
+            notify_proxy = bus.get_object(self.cfg.get('dbus', 'item'),
+                                          self.cfg.get('dbus', 'path'))
+            return dbus.Interface(notify_proxy, self.cfg.get('dbus', 'interface'))
+        except dbus.exceptions.DBusException as err:
+            self.logger.error("Failed dbus setup: %s", err)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        """ Send what is queued, then stop the dispatcher. """
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def put(self, source, title, link, cluster=None, watched=()):
+        """
+        Queue an article for notification, never blocks. watched are the
+        watch-listed advisory ids it names.
+        """
+        self.queue.put((time.monotonic(), source, title, link, cluster, list(watched)))
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def latency(self):
+        """ Average seconds from queued to sent. """
+        with self.lock:
+            sent = self.stats['sent']
+            return self.stats['latency'] / sent if sent else 0.0
+
+    def dispatch(self):
+        self.interface = self.init_notifier()
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            # Collect what arrives within the window to group by source
+            batch = [item]
+            deadline = item[0] + self.window
+            while True:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            # Keep draining the queue, a dead dispatcher would let it grow
+            try:
+                self.send_batch(batch)
+            except Exception:
+                self.logger.exception("Failed notifying %d articles", len(batch))
+
+    def send_batch(self, batch):
+        """ Notify a batch of queued articles, grouped by source and cluster. """
+        by_source = collections.OrderedDict()
+        for queued, source, title, link, also, watched in self.merge_duplicates(batch):
+            by_source.setdefault(source, list()).append((queued, title, link, also, watched))
+        for source, articles in by_source.items():
+            self.send_source(source, articles)
+
+    def merge_duplicates(self, batch):
+        """
+        Keep the first article of each cluster with the other sources it
+        was seen in, and drop the articles of clusters notified by an earlier
+        batch. Critical articles are kept on their own, naming the sources
+        their cluster was notified from.
+        batch -> list(tuple(queued, source, title, link, cluster, list(id)))
+        merged -> list(tuple(queued, source, title, link, list(source), list(id)))
+        """
+        merged = list()
+        first = dict()
+        for queued, source, title, link, cluster, watched in batch:
+            critical = watched or self.ack_keywords.search(title)
+            if cluster is None:
+                merged.append((queued, source, title, link, list(), watched))
+            elif cluster in first and not critical:
+                also = first[cluster][4]
+                if source != first[cluster][1] and source not in also:
+                    also.append(source)
+            elif cluster in self.notified and not critical:
+                self.logger.debug("Suppressed: [%s] %s | already notified from %s",
+                                  source, title, ', '.join(self.notified[cluster]))
+                self.remember(cluster, [source])
+            else:
+                seen = list(self.notified.get(cluster, ()))
+                if cluster in first:
+                    seen += [first[cluster][1]] + first[cluster][4]
+                also = [other for other in dict.fromkeys(seen) if other != source]
+                entry = (queued, source, title, link, also, watched)
+                merged.append(entry)
+                first.setdefault(cluster, entry)
+                self.remember(cluster, [source])
+
+        for cluster, (queued, source, title, link, also, watched) in first.items():
+            self.remember(cluster, also)
+        with self.lock:
+            self.stats['duplicates'] += len(batch) - len(merged)
+        return merged
+
+    def remember(self, cluster, sources):
+        """ Add sources to those a cluster was notified from. """
+        notified = self.notified.setdefault(cluster, list())
+        notified.extend(source for source in sources if source not in notified)
+        self.notified.move_to_end(cluster)
+        if len(self.notified) > self.NOTIFIED:
+            self.notified.popitem(last=False)
+
+    def send_source(self, source, articles):
+        # Articles that must be acknowledged are never grouped
+        grouped = list()
+        for queued, title, link, also, watched in articles:
+            if watched or self.ack_keywords.search(title):
+                self.notify(source, title, link, queued, also, watched)
+            else:
+                grouped.append((queued, title, link, also))
+
+        if len(grouped) >= self.coalesce_min:
+            self.notify_summary(source, grouped)
+        else:
+            for queued, title, link, also in grouped:
+                self.notify(source, title, link, queued, also)
+
+    def notify(self, source, title, link, queued, also=(), watched=()):
+        import jinja2
+        # Require user to acknowledge selected Security news and watched ids
+        matched = self.ack_keywords.match(title) | set(watched)
+        if matched:
+            self.logger.debug("Acknowledge: %s | %s", source, ', '.join(sorted(matched)))
+            urgency = 2
+            actions = ['0', 'Acknowledge']
+        else:
+            urgency = 1
+            actions = []
+
+        try:
+            summary, description = self.templates.render(source, title, link, urgency, also)
+        except jinja2.TemplateError as err:
+            self.logger.error("Failed constructing message: %s", err)
+            return
+        self.send(summary, description, actions, urgency, [queued])
+
+    def notify_summary(self, source, articles):
+        import jinja2
+        try:
+            summary, description = self.templates.render_summary(
+                source, [(title, link) for queued, title, link, also in articles])
+        except jinja2.TemplateError as err:
+            self.logger.error("Failed constructing message: %s", err)
+            return
+        self.send(summary, description, [], 1,
+                  [queued for queued, title, link, also in articles])
+        with self.lock:
+            self.stats['coalesced'] += len(articles)
+
+    def send(self, summary, description, actions, urgency, queued):
+        """
+        Method signature: https://developer.gnome.org/notification-spec/
+        """
+        if self.interface is None:
+            self.logger.error("Failed sending notification: no dbus interface | %s", summary)
+            return
+        import dbus
+        try:
+            self.interface.Notify(self.cfg.get('dbus', 'app_name'), dbus.UInt32(0),
+                                  self.cfg.get('dbus', 'app_icon'), summary, description,
+                                  actions, {'urgency': dbus.Byte(urgency)},
+                                  self.cfg.getint('dbus', 'timeout'))
+        except (AttributeError, dbus.exceptions.DBusException) as err:
+            self.logger.error("Failed sending notification: %s", err)
+            return
+
+        now = time.monotonic()
+        with self.lock:
+            self.stats['sent'] += len(queued)
+            self.stats['notifications'] += 1
+            self.stats['latency'] += sum(now - t for t in queued)
+        self.logger.debug("Notified: %s | queue depth: %d | latency: %.1fs",
+                          summary, self.depth(), now - min(queued))
+
+        # Throttle notifications
+        time.sleep(self.delay)
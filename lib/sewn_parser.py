@@ -15,79 +15,200 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
 """
-import urllib
+import io
+import re
+import contextlib
+import urllib.parse
 from lxml import etree
-import time
-import sched
-import dbus
-import jinja2
-import datetime
 import unicodedata
+import lib.sewn_exceptions as SEWNExceptions
+from lib.sewn_marks import SEWNMarks
 
 class SEWNParser(object):
     first_run = True
-    sched_priority = 1
-
-    def __init__(self, cfg, logger, articles, event):
+    # sy:updatePeriod in seconds
+    UPDATE_PERIODS = {'hourly': 3600, 'daily': 86400, 'weekly': 604800,
+                      'monthly': 2592000, 'yearly': 31536000}
+    HINT_NS = {'purl': 'http://purl.org/rss/1.0/',
+               'sy': 'http://purl.org/rss/1.0/modules/syndication/'}
+    # Tag of a feed item, subclasses that set it support streaming parse
+    ITEM_TAG = None
+    # CVE, Red Hat/CentOS errata and FreeBSD advisory/errata notice ids
+    ADVISORY_ID = re.compile(r'\b(CVE-\d{4}-\d{4,}|(?:RH|CE)[SBE]A-\d{4}:\d{4,}'
+                             r'|FreeBSD-(?:SA|EN)-\d{2}:\d{2}\.\w+)', re.IGNORECASE)
+
+    def __init__(self, cfg, logger, history, fetcher):
         self.cfg = cfg
         self.logger = logger
-        self.articles = articles
-        self.event = event
+        self.history = history
+        self.fetcher = fetcher
+        # Default of the sources that do not set 'streaming' themselves
+        self.streaming = cfg.getboolean('parser', 'streaming', fallback=False)
+        # source -> bool, from sewn-sources.ini
+        self.stream_sources = dict()
+        self.chunk_size = cfg.getint('parser', 'chunk_size', fallback=16384)
+        self.marks = SEWNMarks(cfg, logger, history)
 
         self.parser = self.init_parser()
-        self.notifier = self.init_notifier()
-        self.scheduler = self.init_scheduler()
 
     def init_parser(self):
         return etree.XMLParser(ns_clean=False, recover=True)
 
-    def init_scheduler(self):
-        return sched.scheduler(time.time, time.sleep)
+    def headers(self, identify):
+        headers = dict()
+        if identify:
+            headers['From'] = self.cfg.get('main', 'from')
+            headers['User-Agent'] = self.cfg.get('main', 'user_agent')
+        return headers
 
-    def start_scheduler(self, next_check, func, *args):
-        self.logger.debug("Starting scheduler, next check in %s seconds (%s)", next_check, args)
-        self.scheduler.enter(next_check, self.sched_priority, func, *args)
+    def load_payload(self, feed, identify=False):
+        """ Fetch the raw feed. """
+        try:
+            self.logger.info("Loading feed: %s", feed)
+            return self.fetcher.fetch(feed, self.headers(identify))
+        except IOError as err:
+            self.logger.error("Failed loading feed: %s (%s)", feed, err)
+            return None
 
-        # Run the scheduled event. If shutdown event is set during wait,
-        # unblock and since run() event is execute before check, it is skipped.
-        self.event.wait(next_check)
-        self.scheduler.run(blocking=False)
-        self.event.clear()
+    def set_streaming(self, source, streaming):
+        """ Stream source or not, None for the [parser] streaming default. """
+        if streaming is None:
+            self.stream_sources.pop(source, None)
+        else:
+            self.stream_sources[source] = streaming
 
-    def init_notifier(self):
-        try:
-            bus = dbus.SessionBus()
-            notify_proxy = bus.get_object(self.cfg.get('dbus', 'item'),
-                                          self.cfg.get('dbus', 'path'))
-            return dbus.Interface(notify_proxy, self.cfg.get('dbus', 'interface'))
-        except dbus.exceptions.DBusException as err:
-            self.logger.error("Failed dbus setup: %s" % err)
+    def streams(self, source):
+        """ Whether source is parsed while downloading, see parse_stream(). """
+        return self.ITEM_TAG is not None and self.stream_sources.get(source, self.streaming)
 
     def load_feed(self, feed, identify=False):
+        body = self.load_payload(feed, identify)
+        if body is None:
+            return None
         try:
-            request = urllib.request.Request(feed)
-            if identify:
-                request.add_header('From', self.cfg.get('main', 'from'))
-                request.add_header('User-Agent', self.cfg.get('main', 'user_agent'))
-            self.logger.info("Loading feed: %s", feed)
-            response = urllib.request.urlopen(request)
-            self.logger.debug("feed: %s | headers: %s" % (feed, response.info()._headers))
-            return etree.parse(response, self.parser)
-        except (IOError, etree.XMLSyntaxError) as err:
-            self.logger.error("Failed loading feed: %s (%s)" % (feed, err))
+            doc = etree.parse(io.BytesIO(body), self.parser)
+        except etree.XMLSyntaxError as err:
+            self.logger.error("Failed loading feed: %s (%s)", feed, err)
             return None
+        self.set_hints(feed, doc)
+        return doc
+
+    def parse_payload(self, source, body, keywords):
+        """
+        Parse a raw feed without fetcher or history, e.g. in a pool worker.
+        result -> tuple(list(tuple(source, title, link)), dict(hint: seconds))
+        """
+        try:
+            doc = etree.parse(io.BytesIO(body), self.parser)
+        except etree.XMLSyntaxError as err:
+            raise SEWNExceptions.ArticleParseFailed(source, err)
+        return list(self.parse_document(source, doc, keywords)), self.feed_hints(doc)
+
+    def parse_document(self, source, doc, keywords):
+        """ Yield articles of a parsed feed. """
+        raise NotImplementedError
+
+    def articles(self, source, items, keywords):
+        """
+        Yield articles from (title, link) items in feed order, filtered on
+        keywords. Stops at the high-water mark of source once the feed is
+        known to list the newest items first.
+        """
+        scan = self.marks.scan(source)
+        for title, link in items:
+            title = self.sanitize(title)
+            wanted = not keywords or self.check_keyword(title, keywords)
+            if scan and scan.stop(title, link, wanted):
+                break
+            if wanted:
+                yield (source, title, link)
+        # Not reached on errors, so a failed check never moves the mark
+        if scan:
+            scan.finish()
+
+    def set_hints(self, feed, doc):
+        for name, seconds in self.feed_hints(doc).items():
+            self.fetcher.set_hint(feed, name, seconds)
+
+    def feed_hints(self, doc):
+        """ Poll interval hints from RSS ttl and sy:updatePeriod/updateFrequency. """
+        hints = dict()
+        for channel in (doc.find('channel'), doc.find('purl:channel', namespaces=self.HINT_NS)):
+            if channel is None:
+                continue
+            ttl = channel.findtext('ttl')
+            if ttl and ttl.strip().isdigit():
+                hints['ttl'] = int(ttl) * 60
+            period = channel.findtext('sy:updatePeriod', namespaces=self.HINT_NS)
+            if period and period.strip() in self.UPDATE_PERIODS:
+                frequency = channel.findtext('sy:updateFrequency', '1', namespaces=self.HINT_NS)
+                frequency = int(frequency) if frequency.strip().isdigit() else 1
+                hints['update_period'] = self.UPDATE_PERIODS[period.strip()] // max(1, frequency)
+        return hints
+
+    def stream_feed(self, feed, identify=False):
+        """
+        Yield each item element of feed as soon as it is closed, and free it
+        and its preceding siblings once the caller is done with it. Poll
+        interval hints are read from the channel before its first item.
+        """
+        self.logger.info("Streaming feed: %s", feed)
+        pull_parser = etree.XMLPullParser(events=('end',), tag=self.ITEM_TAG,
+                                          ns_clean=False, recover=True)
+        hinted = False
+        for chunk in self.fetcher.fetch_stream(feed, self.headers(identify), self.chunk_size):
+            pull_parser.feed(chunk)
+            for event, element in pull_parser.read_events():
+                if not hinted:
+                    # The channel elements before the item are freed with it
+                    self.set_hints(feed, element.getroottree())
+                    hinted = True
+                yield element
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+        root = pull_parser.close()
+        if not hinted and root is not None:
+            self.set_hints(feed, root.getroottree())
+
+    def parse_stream(self, source, feed, keywords, identify=False):
+        """
+        Yield articles from feed while it is downloaded, and stop at the
+        first article already in history since the rest has been seen. Only
+        for sources listing the newest articles first, see streams().
+        """
+        try:
+            with contextlib.closing(self.stream_feed(feed, identify)) as articles:
+                for article in articles:
+                    title, link = self.parse_item(article)
+                    if keywords and not self.check_keyword(title, keywords):
+                        continue
+                    post = (source, self.sanitize(title), link)
+                    if not self.is_new(*post):
+                        break
+                    yield post
+        except (AttributeError, IOError, etree.XMLSyntaxError) as err:
+            raise SEWNExceptions.ArticleParseFailed(source, err)
+
+    def parse_item(self, article):
+        """ Return title and link of an item element. """
+        raise NotImplementedError
 
     def check_keyword(self, title, keywords):
-        return any(keyword.lower() in title.lower() for keyword in keywords)
+        """ keywords -> SEWNMatcher """
+        return keywords.search(title)
 
-    def is_new(self, title):
+    def is_new(self, source, title, link):
         """ Check if article is never before seen. """
-        if not self.articles:
-            return True
-        return title not in self.articles
+        return self.history.is_new(source, title, link)
+
+    def add_article(self, source, title, link):
+        self.history.add(source, title, link)
 
-    def add_article(self, title):
-        self.articles.append(title)
+    def extract_ids(self, title, link):
+        """ Advisory ids named in title or link, upper case. """
+        text = '%s %s' % (title, urllib.parse.unquote(link or ''))
+        return frozenset(match.upper() for match in self.ADVISORY_ID.findall(text))
 
     def sanitize(self, title):
         # Remap white space and carriage return
@@ -98,46 +219,3 @@ class SEWNParser(object):
 
         # Normalize unicode
         return unicodedata.normalize('NFC', title.translate(remap))
-
-    def next_check_feed(self, next_check, func, *args):
-        time_now = datetime.datetime.now()
-        next_datetime = time_now + datetime.timedelta(seconds=next_check)
-        self.logger.debug("Next check at: %s (%s)",
-                          next_datetime.strftime('%Y-%m-%d %H:%M:%S'), args)
-
-        # Schedule another check at next_datetime
-        self.scheduler.enter(next_check, self.sched_priority, func, *args)
-
-        # Run the scheduled event. If shutdown event is set during wait,
-        # unblock and skip run.
-        self.event.wait(next_check)
-        self.event.clear()
-
-    def notify(self, source, link, title, actions=[], hints={}):
-        """
-        Method signature: https://developer.gnome.org/notification-spec/
-        """
-        # Require user to acknowledge selected Security news
-        keywords = self.cfg.get('main', 'ack_keywords').split(',')
-        if any(keyword.lower() in title.lower() for keyword in keywords):
-            hints = {'urgency': dbus.Byte(2)}
-            actions = ['0', 'Acknowledge']
-        else:
-            hints = {'urgency': dbus.Byte(1)}
-
-        try:
-            env = jinja2.Environment(loader=jinja2.PackageLoader('sewn', 'templates'))
-            template = env.get_template('notification.jin')
-            message = template.render(data=(source, title, link))
-            summary = message.splitlines()[0]
-            description = '\r'.join(message.splitlines()[1:])
-
-            self.notifier.Notify(self.cfg.get('dbus', 'app_name'), dbus.UInt32(0),
-                                 self.cfg.get('dbus', 'app_icon'), summary, description,
-                                 actions, hints, self.cfg.getint('dbus', 'timeout'))
-            # Throttle notifications
-            time.sleep(self.cfg.getint('dbus', 'delay'))
-        except jinja2.TemplateError as err:
-            self.logger.error("Failed constructing message: %s" % err)
-        except dbus.exceptions.DBusException as err:
-            self.logger.error("Failed sending notification: %s" % err)
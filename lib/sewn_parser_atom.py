@@ -21,23 +21,29 @@ import lib.sewn_exceptions as SEWNExceptions
 
 class SEWNParserAtom(SEWNParser):
 
+    NS = {"atom": "http://www.w3.org/2005/Atom"}
+    ITEM_TAG = '{http://www.w3.org/2005/Atom}entry'
+
     def parse(self, source, feed, keywords, next_check, identify):
         """
         Load feed and parse articles to find title and link.
         If keyword is defined, only add selected articles.
         """
-        new_posts = list()
+        if self.streams(source):
+            return super().parse_stream(source, feed, keywords, identify)
+
         doc = super().load_feed(feed, identify)
+        if doc is None:
+            raise SEWNExceptions.ArticleParseFailed(source, "failed loading feed")
+        return self.parse_document(source, doc, keywords)
 
-        ns = {"atom": "http://www.w3.org/2005/Atom"}
+    def parse_document(self, source, doc, keywords):
         try:
-            for article in doc.iterfind("atom:entry", namespaces=ns):
-                title = article.findtext("atom:title", namespaces=ns)
-                link = article.find(".//atom:link[@rel='alternate']", namespaces=ns).get('href')
-                if keywords and not super().check_keyword(title, keywords):
-                    continue
-                new_posts.append((source, super().sanitize(title), link))
+            items = (self.parse_item(article) for article in doc.iterfind("atom:entry", namespaces=self.NS))
+            yield from super().articles(source, items, keywords)
         except (AttributeError, etree.XMLSyntaxError) as err:
             raise SEWNExceptions.ArticleParseFailed(source, err)
 
-        return new_posts
+    def parse_item(self, article):
+        return (article.findtext("atom:title", namespaces=self.NS),
+                article.find(".//atom:link[@rel='alternate']", namespaces=self.NS).get('href'))
@@ -21,23 +21,29 @@ import lib.sewn_exceptions as SEWNExceptions
 
 class SEWNParserGMANE(SEWNParser):
 
+    NS = {"purl": "http://purl.org/rss/1.0/"}
+    ITEM_TAG = '{http://purl.org/rss/1.0/}item'
+
     def parse(self, source, feed, keywords, next_check, identify):
         """
         Load feed and parse articles to find title and link.
         If keyword is defined, only add selected articles.
         """
-        new_posts = list()
+        if self.streams(source):
+            return super().parse_stream(source, feed, keywords)
+
         doc = super().load_feed(feed)
+        if doc is None:
+            raise SEWNExceptions.ArticleParseFailed(source, "failed loading feed")
+        return self.parse_document(source, doc, keywords)
 
+    def parse_document(self, source, doc, keywords):
         try:
-            ns = {"purl": "http://purl.org/rss/1.0/"}
-            for article in doc.iterfind('purl:item', namespaces=ns):
-                title = article.findtext("purl:title", namespaces=ns)
-                link = article.findtext("purl:link", namespaces=ns)
-                if keywords and not super().check_keyword(title, keywords):
-                    continue
-                new_posts.append((source, super().sanitize(title), link))
+            items = (self.parse_item(article) for article in doc.iterfind('purl:item', namespaces=self.NS))
+            yield from super().articles(source, items, keywords)
         except (AttributeError, etree.XMLSyntaxError) as err:
             raise SEWNExceptions.ArticleParseFailed(source, err)
 
-        return new_posts
+    def parse_item(self, article):
+        return (article.findtext("purl:title", namespaces=self.NS),
+                article.findtext("purl:link", namespaces=self.NS))
@@ -15,7 +15,7 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
 """
-import requests
+import json
 from lib.sewn_parser import SEWNParser
 import lib.sewn_exceptions as SEWNExceptions
 
@@ -23,12 +23,12 @@ class SEWNParserReddit(SEWNParser):
 
     REDDIT = 'https://www.reddit.com'
 
-    def __init__(self, cfg, logger, articles, event):
-        super().__init__(cfg, logger, articles, event)
+    def __init__(self, cfg, logger, history, fetcher):
+        super().__init__(cfg, logger, history, fetcher)
         self.from_user = cfg.get('reddit', 'from')
         self.user_agent = cfg.get('main', 'user_agent')
 
-    def load_rss_feed(self, feed, identify):
+    def load_payload(self, feed, identify=False):
         try:
             if identify:
                 headers = {'From': self.from_user,
@@ -36,11 +36,19 @@ class SEWNParserReddit(SEWNParser):
             else:
                 headers = None
             self.logger.info("Loading Reddit feed: %s", feed)
-            response = requests.get(feed, headers=headers)
-            self.logger.debug("feed: %s | headers: %s" % (feed, response.headers))
-            return response.json()
-        except (IOError, ValueError) as err:
-            self.logger.error("Failed loading reddit feed: %s" % err)
+            return self.fetcher.fetch(feed, headers)
+        except IOError as err:
+            self.logger.error("Failed loading reddit feed: %s", err)
+            return None
+
+    def load_rss_feed(self, feed, identify):
+        body = self.load_payload(feed, identify)
+        if body is None:
+            return None
+        try:
+            return json.loads(body.decode('utf-8'))
+        except ValueError as err:
+            self.logger.error("Failed loading reddit feed: %s", err)
             return None
 
     def parse(self, source, feed, keywords, next_check, identify):
@@ -48,17 +56,23 @@ class SEWNParserReddit(SEWNParser):
         Load feed and parse articles to find title and link.
         If keyword is defined, only add selected articles.
         """
-        new_posts = list()
         data = self.load_rss_feed(feed, identify)
+        if data is None:
+            raise SEWNExceptions.ArticleParseFailed(source, "failed loading feed")
+        return self.parse_document(source, data, keywords)
 
+    def parse_payload(self, source, body, keywords):
         try:
-            for submission in (data['data']['children']):
-                title = submission['data']['title']
-                link = submission['data']['permalink']
-                if keywords and not super().check_keyword(title, keywords):
-                    continue
-                new_posts.append((source, super().sanitize(title), "%s%s" % (self.REDDIT, link)))
-        except (AttributeError, KeyError, TypeError) as err:
+            data = json.loads(body.decode('utf-8'))
+        except ValueError as err:
             raise SEWNExceptions.ArticleParseFailed(source, err)
+        return list(self.parse_document(source, data, keywords)), dict()
 
-        return new_posts
+    def parse_document(self, source, data, keywords):
+        try:
+            items = ((submission['data']['title'],
+                      "%s%s" % (self.REDDIT, submission['data']['permalink']))
+                     for submission in data['data']['children'])
+            yield from super().articles(source, items, keywords)
+        except (AttributeError, KeyError, TypeError) as err:
+            raise SEWNExceptions.ArticleParseFailed(source, err)
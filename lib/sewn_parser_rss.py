@@ -21,22 +21,27 @@ import lib.sewn_exceptions as SEWNExceptions
 
 class SEWNParserRSS(SEWNParser):
 
+    ITEM_TAG = 'item'
+
     def parse(self, source, feed, keywords, next_check, identify):
         """
         Load feed and parse articles to find title and link.
         If keyword is defined, only add selected articles.
         """
-        new_posts = list()
+        if self.streams(source):
+            return super().parse_stream(source, feed, keywords, identify)
+
         doc = super().load_feed(feed, identify)
+        if doc is None:
+            raise SEWNExceptions.ArticleParseFailed(source, "failed loading feed")
+        return self.parse_document(source, doc, keywords)
 
+    def parse_document(self, source, doc, keywords):
         try:
-            for article in doc.iterfind('channel/item'):
-                title = article.findtext('title')
-                link = article.findtext('link')
-                if keywords and not super().check_keyword(title, keywords):
-                    continue
-                new_posts.append((source, super().sanitize(title), link))
+            items = (self.parse_item(article) for article in doc.iterfind('channel/item'))
+            yield from super().articles(source, items, keywords)
         except (AttributeError, etree.XMLSyntaxError) as err:
             raise SEWNExceptions.ArticleParseFailed(source, err)
 
-        return new_posts
+    def parse_item(self, article):
+        return article.findtext('title'), article.findtext('link')
@@ -21,6 +21,9 @@ import lib.sewn_exceptions as SEWNExceptions
 
 class SEWNParserXML(SEWNParser):
 
+    NS = {'atom': 'http://www.w3.org/2005/Atom'}
+    ITEM_TAG = '{http://www.w3.org/2005/Atom}entry'
+
     def parse(self, source, feed, keywords, next_check, identify):
         """
         Load feed and parse articles to find title and link.
@@ -30,22 +33,24 @@ class SEWNParserXML(SEWNParser):
         <feed><entry><title>title</feed></entry></title>
         <feed><entry><link>link</feed></entry></link>
         """
-        new_posts = list()
+        if self.streams(source):
+            return super().parse_stream(source, feed, keywords)
+
         doc = super().load_feed(feed)
+        if doc is None:
+            raise SEWNExceptions.ArticleParseFailed(source, "failed loading feed")
+        return self.parse_document(source, doc, keywords)
 
+    def parse_document(self, source, doc, keywords):
         try:
-            ns = {'atom': 'http://www.w3.org/2005/Atom'}
             path = '//atom:feed/atom:entry/atom:title|//atom:feed/atom:entry/atom:link'
-            entries = doc.xpath(path, namespaces=ns)
-            articles = zip(entries[::2], entries[1::2])
-
-            for article in articles:
-                title = article[0].text
-                link = article[1].get('href')
-                if keywords and not super().check_keyword(title, keywords):
-                    continue
-                new_posts.append((source, super().sanitize(title), link))
+            entries = doc.xpath(path, namespaces=self.NS)
+            items = ((title.text, link.get('href'))
+                     for title, link in zip(entries[::2], entries[1::2]))
+            yield from super().articles(source, items, keywords)
         except (AttributeError, etree.XMLSyntaxError) as err:
             raise SEWNExceptions.ArticleParseFailed(source, err)
 
-        return new_posts
+    def parse_item(self, article):
+        return (article.findtext("atom:title", namespaces=self.NS),
+                article.find("atom:link", namespaces=self.NS).get('href'))
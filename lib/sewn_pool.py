@@ -0,0 +1,85 @@
+"""
+This file is part of Security Watch Notifier (sewn.py).
+Copyright (C) 2015 Espen Hovind <espehov@ifi.uio.no>
+
+sewn.py is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+sewn.py is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import concurrent.futures
+import configparser
+import logging
+import multiprocessing
+import os
+import lib.sewn_exceptions as SEWNExceptions
+
+# Per worker process: config and one parser per parser class
+worker_cfg = None
+worker_parsers = dict()
+
+def init_worker(config):
+    global worker_cfg
+    worker_cfg = configparser.ConfigParser(allow_no_value=True)
+    worker_cfg.read(config)
+
+def parse_worker(parser_class, source, body, keywords):
+    """ Raw feed in, (articles, hints) out. Runs in a pool worker. """
+    parser = worker_parsers.get(parser_class)
+    if parser is None:
+        parser = parser_class(worker_cfg, logging.getLogger(), None, None)
+        worker_parsers[parser_class] = parser
+    try:
+        return parser.parse_payload(source, body, keywords)
+    except SEWNExceptions.ArticleParseFailed as err:
+        # The cause may not pickle, send it back as text
+        raise SEWNExceptions.ArticleParseFailed(source, str(err.message))
+
+
+class SEWNPool(object):
+    """
+    Parse stage in worker processes.
+
+    The fetch stays in the calling thread. Only the raw body is sent to a
+    worker, which parses, filters on keywords and sanitizes, so lxml and
+    unicode normalization of many feeds run in parallel outside the GIL of
+    the main process.
+    """
+
+    def __init__(self, cfg, logger, config):
+        self.logger = logger
+        processes = cfg.get('parser', 'processes', fallback='0').strip()
+        self.processes = os.cpu_count() if processes == 'auto' else int(processes or 0)
+        self.executor = None
+        if self.processes > 0:
+            # Spawn, since forking a process with running threads is unsafe
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.processes, mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker, initargs=(config,))
+            self.logger.info("Parser pool: %d processes", self.processes)
+
+    def __bool__(self):
+        return self.executor is not None
+
+    def parse(self, parser, source, feed, keywords, identify):
+        """ Fetch feed here and parse it in a worker. """
+        body = parser.load_payload(feed, identify)
+        if body is None:
+            raise SEWNExceptions.ArticleParseFailed(source, "failed loading feed")
+        articles, hints = self.executor.submit(parse_worker, type(parser), source,
+                                               body, keywords).result()
+        for name, seconds in hints.items():
+            parser.fetcher.set_hint(feed, name, seconds)
+        return articles
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,74 @@
+"""
+This file is part of Security Watch Notifier (sewn.py).
+Copyright (C) 2015 Espen Hovind <espehov@ifi.uio.no>
+
+sewn.py is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+sewn.py is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import collections
+import contextlib
+import sys
+import threading
+
+class SEWNProfiler(object):
+    """
+    Sampling profiler for source checks.
+
+    A background thread samples the stacks of threads that are inside
+    track() every interval seconds. Samples are written as collapsed stacks
+    rooted at the source name, the input format of flamegraph.pl.
+    """
+
+    def __init__(self, logger, path, interval=0.005):
+        self.logger = logger
+        self.path = path
+        self.interval = interval
+        self.samples = collections.Counter()
+        # thread ident -> source
+        self.tracked = dict()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, name='profiler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    @contextlib.contextmanager
+    def track(self, source):
+        ident = threading.get_ident()
+        self.tracked[ident] = source
+        try:
+            yield
+        finally:
+            del self.tracked[ident]
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            frames = sys._current_frames()
+            for ident, source in list(self.tracked.items()):
+                frame = frames.get(ident)
+                stack = list()
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append('%s:%s' % (code.co_filename.rsplit('/', 1)[-1], code.co_name))
+                    frame = frame.f_back
+                stack.append(source.replace(';', ','))
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        """ Stop sampling and write the collapsed stacks. """
+        self.stopped.set()
+        self.thread.join()
+        with open(self.path, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write('%s %d\n' % (stack, count))
+        self.logger.info("Profile: %s (%d samples)", self.path, sum(self.samples.values()))
@@ -0,0 +1,55 @@
+"""
+This file is part of Security Watch Notifier (sewn.py).
+Copyright (C) 2015 Espen Hovind <espehov@ifi.uio.no>
+
+sewn.py is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+sewn.py is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import importlib
+import threading
+
+class SEWNRegistry(object):
+    """
+    Parser instances keyed by the source 'type'.
+
+    A parser module is imported and its parser built the first time a
+    source of that type is configured, and then shared by all such sources.
+    """
+    PARSERS = {'rss': ('lib.sewn_parser_rss', 'SEWNParserRSS'),
+               'xml': ('lib.sewn_parser_xml', 'SEWNParserXML'),
+               'reddit': ('lib.sewn_parser_reddit', 'SEWNParserReddit'),
+               'gmane': ('lib.sewn_parser_gmane', 'SEWNParserGMANE'),
+               'atom': ('lib.sewn_parser_atom', 'SEWNParserAtom')}
+
+    def __init__(self, cfg, logger, history, fetcher):
+        self.cfg = cfg
+        self.logger = logger
+        self.history = history
+        self.fetcher = fetcher
+        self.parsers = dict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, kind):
+        return kind in self.PARSERS
+
+    def get(self, kind):
+        """ Return the shared parser for a source type, KeyError if unknown. """
+        with self.lock:
+            parser = self.parsers.get(kind)
+            if parser is None:
+                module, name = self.PARSERS[kind]
+                parser_class = getattr(importlib.import_module(module), name)
+                parser = parser_class(self.cfg, self.logger, self.history, self.fetcher)
+                self.parsers[kind] = parser
+                self.logger.debug("Parser: %s -> %s", kind, name)
+            return parser
@@ -0,0 +1,238 @@
+"""
+This file is part of Security Watch Notifier (sewn.py).
+Copyright (C) 2015 Espen Hovind <espehov@ifi.uio.no>
+
+sewn.py is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+sewn.py is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import collections
+import time
+from lib.sewn_clock import SEWNClock
+from lib.sewn_fetcher import SEWNFetcher
+from lib.sewn_notifier import SEWNNotifier
+from lib.sewn_parser import SEWNParser
+import lib.sewn_exceptions as SEWNExceptions
+
+class SEWNReplay(object):
+    """
+    Run the whole pipeline over a snapshot directory in simulated time.
+
+    Time starts at the first recorded response and jumps from one due check
+    to the next, so days of recordings replay in seconds, or at --replay-speed
+    times faster than real time. Checks run one at a time in deadline order and random
+    is seeded, so a replay of the same snapshots gives the same result.
+    """
+    SEED = 0
+
+    def __init__(self, logger, scheduler, notifier, metrics, snapshots, speed=0):
+        self.logger = logger
+        self.scheduler = scheduler
+        self.notifier = notifier
+        self.metrics = metrics
+        self.snapshots = snapshots
+        self.speed = speed
+
+    @staticmethod
+    def scale(sources, copies):
+        """
+        Every source and copies - 1 clones of it, for load beyond the
+        recorded sources. Clones replay the same feed.
+        sources -> dict(name: Source)
+        """
+        scaled = collections.OrderedDict()
+        for name, source in sources.items():
+            scaled[name] = source
+            for n in range(2, copies + 1):
+                clone = '%s #%d' % (name, n)
+                # Fragments are not sent, the replay fetcher drops them
+                scaled[clone] = source._replace(name=clone, feed='%s#replay-%d' % (
+                    source.feed.split('#', 1)[0], n))
+        return scaled
+
+    def run(self, jobs, func):
+        """
+        First run without notifications, then every due check until the
+        end of the recording.
+        jobs -> dict(source: tuple(parser, source, feed, keywords, next_check, identify))
+        result -> dict, see report()
+        """
+        start = time.perf_counter()
+        end = self.snapshots.end
+        SEWNClock.simulate(self.snapshots.start)
+        checks = 0
+        for job in list(jobs.values()):
+            self.check(func, job)
+            checks += 1
+        SEWNParser.first_run = False
+        self.logger.debug("First run done: %d sources", len(jobs))
+        for job in list(jobs.values()):
+            self.scheduler.add(job[1], job[4])
+
+        while True:
+            delay = self.scheduler.next_delay()
+            if delay is None or SEWNClock.time() + delay > end:
+                break
+            # Stop earlier if the pending notifications are due first
+            flush = self.notifier.deadline()
+            if flush is not None:
+                delay = min(delay, max(flush - SEWNClock.monotonic(), 0))
+            if self.speed:
+                time.sleep(delay / self.speed)
+            SEWNClock.advance(delay)
+            self.notifier.flush()
+            for source, deadline in self.scheduler.pop_due():
+                job = jobs.get(source)
+                if job:
+                    self.check(func, job)
+                    checks += 1
+                self.scheduler.reschedule(source)
+        self.notifier.flush(force=True)
+        return self.report(checks, end - self.snapshots.start, time.perf_counter() - start)
+
+    def check(self, func, job):
+        try:
+            func(*job)
+        except Exception:
+            self.logger.exception("Failed checking source: %s", job[1])
+
+    def report(self, checks, simulated, wall):
+        total = self.metrics.total
+        stats = self.notifier.stats
+        return {'responses': len(self.snapshots),
+                'simulated_seconds': simulated,
+                'wall_seconds': wall,
+                'speedup': simulated / wall if wall else 0.0,
+                'checks': checks,
+                'checks_per_second': checks / wall if wall else 0.0,
+                'not_modified': total('sewn_not_modified_total'),
+                'failures': total('sewn_parse_failures_total'),
+                'skipped': total('sewn_checks_skipped_total'),
+                'items': total('sewn_items_total'),
+                'items_per_second': total('sewn_items_total') / wall if wall else 0.0,
+                'new_items': total('sewn_new_items_total'),
+                'duplicates': total('sewn_duplicates_total'),
+                'followups': total('sewn_followups_total'),
+                'fetch_seconds': total('sewn_fetch_seconds'),
+                'parse_seconds': total('sewn_parse_seconds'),
+                'notifications': stats['notifications'],
+                'notified_items': stats['sent'],
+                'coalesced_items': stats['coalesced'],
+                # In simulated time, includes the coalesce window
+                'notify_latency_seconds': self.notifier.latency()}
+
+
+class SEWNReplayFetcher(SEWNFetcher):
+    """
+    Fetcher answering from a snapshot directory at the simulated time.
+
+    A feed gets the latest response recorded at or before now. A recorded
+    304 stands for the last recorded body, and a body already returned to
+    the parser is answered as not modified, like a conditional GET.
+    Recorded errors are raised again.
+    """
+
+    def __init__(self, cfg, logger, snapshots):
+        super().__init__(cfg, logger)
+        self.snapshots = snapshots
+        # feed -> index of the record last returned
+        self.served = dict()
+
+    def fetch(self, feed, headers=None):
+        start = time.perf_counter()
+        record = self.replay(feed)
+        body = self.snapshots.body(record['body'])
+        self.count(modified=1, bytes=record['size'])
+        self.local.last = (time.perf_counter() - start, record['size'])
+        return body
+
+    def fetch_stream(self, feed, headers=None, chunk_size=16384):
+        body = self.fetch(feed, headers)
+        for offset in range(0, len(body), chunk_size):
+            yield body[offset:offset + chunk_size]
+
+    def replay(self, feed):
+        """
+        The record with the body of feed at the simulated time.
+        Raise FeedNotModified and IOError like request().
+        """
+        from requests.structures import CaseInsensitiveDict
+        recorded = feed.split('#', 1)[0]
+        index = self.snapshots.at(recorded, SEWNClock.time())
+        if index is None:
+            raise IOError("not recorded: %s" % recorded)
+        records = self.snapshots.feeds[recorded]
+        record = records[index]
+        self.record_hints(feed, CaseInsensitiveDict(record['headers']))
+        if record['error']:
+            raise IOError(record['error'])
+        if record['status'] >= 400:
+            raise IOError("%d Error for url: %s" % (record['status'], recorded))
+        while record['body'] is None and index > 0:
+            index -= 1
+            record = records[index]
+        if record['body'] is None or self.served.get(feed) == index:
+            self.count(not_modified=1)
+            raise SEWNExceptions.FeedNotModified(feed)
+        self.served[feed] = index
+        return record
+
+    def resolve(self, link):
+        return self.snapshots.resolved.get(link)
+
+
+class SEWNNullNotifier(SEWNNotifier):
+    """
+    Notifier of a replay. Articles are grouped in coalesce windows of
+    simulated time and rendered, but only counted, never sent.
+    """
+
+    def __init__(self, cfg, logger, templates):
+        super().__init__(cfg, logger, templates)
+        self.pending = list()
+
+    def start(self):
+        pass
+
+    def stop(self, timeout=None):
+        self.flush(force=True)
+
+    def put(self, source, title, link, cluster=None, watched=()):
+        with self.lock:
+            self.pending.append((SEWNClock.monotonic(), source, title, link, cluster,
+                                 list(watched)))
+
+    def depth(self):
+        with self.lock:
+            return len(self.pending)
+
+    def deadline(self):
+        """ Simulated time the pending articles are due, None if there are none. """
+        with self.lock:
+            return self.pending[0][0] + self.window if self.pending else None
+
+    def flush(self, force=False):
+        """ Notify the pending articles once the window of the first has passed. """
+        with self.lock:
+            if not self.pending or (not force and
+                                    SEWNClock.monotonic() < self.pending[0][0] + self.window):
+                return
+            batch, self.pending = self.pending, list()
+        self.send_batch(batch)
+
+    def send(self, summary, description, actions, urgency, queued):
+        now = SEWNClock.monotonic()
+        with self.lock:
+            self.stats['sent'] += len(queued)
+            self.stats['notifications'] += 1
+            self.stats['latency'] += sum(now - t for t in queued)
+        self.logger.debug("Notified: %s | latency: %.1fs", summary, now - min(queued))
@@ -0,0 +1,136 @@
+"""
+This file is part of Security Watch Notifier (sewn.py).
+Copyright (C) 2015 Espen Hovind <espehov@ifi.uio.no>
+
+sewn.py is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+sewn.py is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import heapq
+import random
+import itertools
+import threading
+from lib.sewn_clock import SEWNClock
+
+class SEWNScheduler(object):
+    """
+    Process-wide deadline scheduler.
+
+    Keeps a min-heap with at most one live entry per source, ordered by the
+    time the source is due. A source is popped when due and pushed back when
+    its check has finished, so the heap never grows with uptime.
+    """
+
+    def __init__(self, cfg, logger, metrics):
+        self.logger = logger
+        self.metrics = metrics
+        self.jitter = cfg.getfloat('scheduler', 'jitter', fallback=0.1)
+        self.stagger = cfg.getint('scheduler', 'stagger', fallback=60)
+        self.batch_size = cfg.getint('scheduler', 'batch_size', fallback=16)
+        self.batch_window = cfg.getfloat('scheduler', 'batch_window', fallback=1.0)
+
+        self.heap = list()
+        self.entries = dict()
+        self.intervals = dict()
+        # One-off delays of the next reschedule, e.g. backoff after a failure
+        self.deferred = dict()
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    def add(self, key, interval, delay=None):
+        """
+        Schedule a new source, staggered to avoid aligned checks. The first
+        check is one interval from now unless delay is given, or deferred
+        before the source was added (a failed first run check).
+        """
+        with self.lock:
+            self.intervals[key] = interval
+            deferred = self.deferred.pop(key, None)
+            if deferred is not None:
+                self.push(key, SEWNClock.monotonic() + deferred)
+                return
+            if delay is None:
+                delay = self.spread(interval)
+            offset = random.uniform(0, min(interval, self.stagger))
+            self.push(key, SEWNClock.monotonic() + delay + offset)
+
+    def remove(self, key):
+        """ Unschedule a source. Its heap entry is dropped lazily. """
+        with self.lock:
+            self.intervals.pop(key, None)
+            self.entries.pop(key, None)
+            self.deferred.pop(key, None)
+
+    def set_interval(self, key, interval):
+        """ Change the interval used from the next reschedule of a source. """
+        with self.lock:
+            if key in self.intervals:
+                self.intervals[key] = interval
+
+    def defer(self, key, delay):
+        """
+        Use delay instead of the interval for the next reschedule of a
+        source, or for its first check if it has not been added yet.
+        """
+        with self.lock:
+            self.deferred[key] = delay
+
+    def reschedule(self, key):
+        """ Schedule the next check of a source that has been popped. """
+        with self.lock:
+            if key in self.intervals and key not in self.entries:
+                delay = self.deferred.pop(key, None)
+                if delay is None:
+                    delay = self.spread(self.intervals[key])
+                self.push(key, SEWNClock.monotonic() + delay)
+
+    def next_delay(self):
+        """ Seconds until the next source is due, or None if nothing is scheduled. """
+        with self.lock:
+            self.discard_stale()
+            if not self.heap:
+                return None
+            return max(0, self.heap[0][0] - SEWNClock.monotonic())
+
+    def pop_due(self):
+        """
+        Pop up to batch_size sources that are due now, or within the batch
+        window, so sources due close together are checked in one wakeup.
+        due -> list(tuple(key, deadline))
+        """
+        due = list()
+        with self.lock:
+            now = SEWNClock.monotonic()
+            limit = now + self.batch_window
+            while len(due) < self.batch_size:
+                self.discard_stale()
+                if not self.heap or self.heap[0][0] > limit:
+                    break
+                deadline, seq, key = heapq.heappop(self.heap)
+                del self.entries[key]
+                due.append((key, deadline))
+        for key, deadline in due:
+            # Time between the planned and the actual check
+            self.metrics.observe('sewn_scheduler_lag_seconds', max(0, now - deadline))
+        return due
+
+    def spread(self, interval):
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def push(self, key, deadline):
+        seq = next(self.counter)
+        self.entries[key] = seq
+        heapq.heappush(self.heap, (deadline, seq, key))
+
+    def discard_stale(self):
+        while self.heap and self.entries.get(self.heap[0][2]) != self.heap[0][1]:
+            heapq.heappop(self.heap)
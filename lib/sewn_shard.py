@@ -0,0 +1,106 @@
+"""
+This file is part of Security Watch Notifier (sewn.py).
+Copyright (C) 2015 Espen Hovind <espehov@ifi.uio.no>
+
+sewn.py is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+sewn.py is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from lib.sewn_history import SEWNHistory
+
+class SEWNShard(object):
+    """
+    Split sources between several sewn.py instances.
+
+    Sources are assigned with rendezvous hashing: each source goes to the
+    instance with the highest hash of (source, instance). Adding or removing
+    an instance only moves the sources that instance wins or held.
+
+    Articles are claimed in a SQLite database on shared disk before they are
+    notified, so an article is notified once even while two instances check
+    the same source during a rebalance.
+    """
+
+    def __init__(self, cfg, logger):
+        self.logger = logger
+        self.instance = cfg.getint('shard', 'instance', fallback=0)
+        self.instances = cfg.getint('shard', 'instances', fallback=1)
+        self.path = cfg.get('shard', 'claims', fallback=None)
+        self.ttl = cfg.getint('shard', 'claims_ttl', fallback=2592000)
+        if not 0 <= self.instance < self.instances:
+            raise ValueError("shard instance %d not in 0..%d" % (self.instance, self.instances - 1))
+
+        self.lock = threading.Lock()
+        self.db = None
+        self.since_prune = 0
+        if self.path:
+            self.db = self.init_db()
+
+    def init_db(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                             isolation_level=None)
+        db.execute("CREATE TABLE IF NOT EXISTS claims "
+                   "(key BLOB PRIMARY KEY, instance INTEGER, claimed REAL)")
+        db.execute("CREATE INDEX IF NOT EXISTS claims_claimed ON claims (claimed)")
+        return db
+
+    @staticmethod
+    def weight(source, instance):
+        data = ('%s\x1f%d' % (source, instance)).encode('utf-8')
+        return hashlib.blake2b(data, digest_size=8).digest()
+
+    def owner(self, source):
+        return max(range(self.instances), key=lambda instance: self.weight(source, instance))
+
+    def owns(self, source):
+        return self.instances == 1 or self.owner(source) == self.instance
+
+    def claim(self, articles):
+        """
+        Return the articles this instance won the claim for.
+        articles -> list(tuple(source, title, link))
+        """
+        if self.db is None or not articles:
+            return articles
+        now = time.time()
+        won = list()
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                for article in articles:
+                    cursor = self.db.execute(
+                        "INSERT OR IGNORE INTO claims VALUES (?, ?, ?)",
+                        (SEWNHistory.key(*article), self.instance, now))
+                    if cursor.rowcount == 1:
+                        won.append(article)
+                self.since_prune += len(won)
+                # Prune old claims now and then, they are in every history by then
+                if self.since_prune >= 1000:
+                    self.db.execute("DELETE FROM claims WHERE claimed < ?", (now - self.ttl,))
+                    self.since_prune = 0
+                self.db.execute("COMMIT")
+            except sqlite3.Error:
+                self.db.execute("ROLLBACK")
+                raise
+        return won
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
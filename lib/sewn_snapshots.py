@@ -0,0 +1,135 @@
+"""
+This file is part of Security Watch Notifier (sewn.py).
+Copyright (C) 2015 Espen Hovind <espehov@ifi.uio.no>
+
+sewn.py is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+sewn.py is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import bisect
+import collections
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import threading
+from lib.sewn_clock import SEWNClock
+
+class SEWNRecorder(object):
+    """
+    Record every feed response into a snapshot directory for replay.
+
+    index.jsonl gets one line per response: time, feed, status, headers,
+    wire size, and the body digest or the error. Bodies are stored gzipped
+    once per digest in bodies/, so a feed served unchanged costs an index
+    line. The sources file is copied to sources.ini when recording starts.
+    """
+    LEVEL = 6
+
+    def __init__(self, logger, path, sources):
+        self.logger = logger
+        self.path = path
+        os.makedirs(os.path.join(path, 'bodies'), exist_ok=True)
+        shutil.copyfile(sources, os.path.join(path, 'sources.ini'))
+        self.bodies = set(name.split('.', 1)[0]
+                          for name in os.listdir(os.path.join(path, 'bodies')))
+        self.lock = threading.Lock()
+        self.index = open(os.path.join(path, 'index.jsonl'), 'a')
+        self.logger.info("Recording: %s", path)
+
+    def record(self, feed, status, headers, body=None, size=0, error=None):
+        """ Record one response, or the error that stopped it. """
+        digest = None
+        if body is not None:
+            digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+        entry = json.dumps({'time': SEWNClock.time(), 'feed': feed, 'status': status,
+                            'headers': dict(headers or {}), 'body': digest, 'size': size,
+                            'error': error})
+        with self.lock:
+            if digest and digest not in self.bodies:
+                self.write_body(digest, body)
+                self.bodies.add(digest)
+            self.index.write(entry + '\n')
+            self.index.flush()
+
+    def record_resolve(self, link, url):
+        """ Record where a link redirected to. """
+        entry = json.dumps({'time': SEWNClock.time(), 'resolve': link, 'url': url})
+        with self.lock:
+            self.index.write(entry + '\n')
+            self.index.flush()
+
+    def write_body(self, digest, body):
+        path = os.path.join(self.path, 'bodies', digest + '.gz')
+        with open(path + '.tmp', 'wb') as f:
+            f.write(gzip.compress(body, self.LEVEL))
+        os.replace(path + '.tmp', path)
+
+    def close(self):
+        with self.lock:
+            self.index.close()
+
+
+class SEWNSnapshots(object):
+    """ Responses of a snapshot directory, per feed in time order. """
+
+    def __init__(self, path):
+        self.path = path
+        self.sources = os.path.join(path, 'sources.ini')
+        # feed -> list(record), and the times of those records for bisect
+        self.feeds = collections.defaultdict(list)
+        self.times = dict()
+        self.resolved = dict()
+        self.load()
+
+    def load(self):
+        """ Raise OSError if there is no index. """
+        with open(os.path.join(self.path, 'index.jsonl'), 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Partial last line of an interrupted recording
+                    continue
+                if 'resolve' in record:
+                    self.resolved[record['resolve']] = record['url']
+                else:
+                    self.feeds[record['feed']].append(record)
+        for feed, records in self.feeds.items():
+            records.sort(key=lambda record: record['time'])
+            self.times[feed] = [record['time'] for record in records]
+
+    def __len__(self):
+        return sum(len(records) for records in self.feeds.values())
+
+    @property
+    def start(self):
+        return min((times[0] for times in self.times.values()), default=0.0)
+
+    @property
+    def end(self):
+        return max((times[-1] for times in self.times.values()), default=0.0)
+
+    def at(self, feed, now):
+        """
+        Index of the latest response of feed at time now (the first one
+        before the recording of feed started), None if feed was not recorded.
+        """
+        times = self.times.get(feed)
+        if not times:
+            return None
+        return max(bisect.bisect_right(times, now) - 1, 0)
+
+    def body(self, digest):
+        with open(os.path.join(self.path, 'bodies', digest + '.gz'), 'rb') as f:
+            return gzip.decompress(f.read())
@@ -0,0 +1,144 @@
+"""
+This file is part of Security Watch Notifier (sewn.py).
+Copyright (C) 2015 Espen Hovind <espehov@ifi.uio.no>
+
+sewn.py is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+sewn.py is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import collections
+import configparser
+import marshal
+import os
+import sys
+import urllib.parse
+from lib.sewn_templates import SEWNTemplates
+
+Source = collections.namedtuple('Source', 'name feed type keywords interval identify template streaming')
+
+class SEWNSources(object):
+    """
+    Validated sources from sewn-sources.ini.
+
+    Every section is checked once (feed URL, known type, interval, flags,
+    template) and reduced to a Source with its keywords split. An invalid
+    source is logged and left out instead of failing the whole file. The
+    result is cached in [sources] cache with marshal, and reused until the
+    file or the templates change, so thousands of sources load without
+    configparser.
+    """
+    VERSION = 3
+
+    def __init__(self, cfg, logger, path, types):
+        self.logger = logger
+        self.path = path
+        self.types = frozenset(types)
+        self.cache = cfg.get('sources', 'cache', fallback=None)
+
+    def stamp(self):
+        """ Identifies the sources file and everything the cache depends on. """
+        stat = os.stat(self.path)
+        templates = os.stat(SEWNTemplates.DIRECTORY).st_mtime_ns
+        return (self.VERSION, sys.version_info[:2], self.path, stat.st_mtime_ns, stat.st_size,
+                tuple(sorted(self.types)), templates)
+
+    def load(self):
+        """
+        sources -> dict(name: Source), in file order
+        Raise OSError or configparser.Error if the file cannot be read.
+        """
+        stamp = self.stamp()
+        cached = self.load_cache(stamp)
+        if cached is None:
+            sources, errors = self.compile()
+            self.save_cache(stamp, sources, errors)
+        else:
+            sources, errors = cached
+        for name, error in errors:
+            self.logger.error("Invalid source: %s (%s)", name, error)
+        return collections.OrderedDict((source.name, source) for source in sources)
+
+    def compile(self):
+        """
+        result -> tuple(list(Source), list(tuple(name, error)))
+        """
+        cfg = configparser.ConfigParser()
+        with open(self.path, 'r') as f:
+            cfg.read_file(f)
+        sources = list()
+        errors = list()
+        for name in cfg.sections():
+            try:
+                sources.append(self.validate(name, cfg[name]))
+            except (ValueError, configparser.Error) as err:
+                errors.append((name, str(err)))
+        return sources, errors
+
+    def validate(self, name, section):
+        """ Return the Source of a section, ValueError if invalid. """
+        feed = section.get('feed', '').strip()
+        if urllib.parse.urlsplit(feed).scheme not in ('http', 'https'):
+            raise ValueError("feed is not a http(s) URL: %r" % feed)
+        kind = section.get('type', '').strip()
+        if kind not in self.types:
+            raise ValueError("unknown type: %r" % kind)
+        if 'check_interval' not in section:
+            raise ValueError("no check_interval")
+        interval = section.getint('check_interval')
+        if interval <= 0:
+            raise ValueError("check_interval must be positive")
+        identify = section.getboolean('identify', fallback=False)
+        keywords = tuple(keyword.strip() for keyword in section.get('keywords', '').split(',')
+                         if keyword.strip())
+        template = section.get('template', None)
+        if template and not SEWNTemplates.exists(template):
+            raise ValueError("template not found: %r" % template)
+        # None falls back to [parser] streaming
+        streaming = section.getboolean('streaming', fallback=None)
+        return Source(name, feed, kind, keywords, interval, identify, template, streaming)
+
+    def load_cache(self, stamp):
+        if not self.cache:
+            return None
+        try:
+            with open(self.cache, 'rb') as f:
+                cached_stamp, sources, errors = marshal.loads(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, ValueError, TypeError) as err:
+            self.logger.debug("Ignored sources cache: %s (%s)", self.cache, err)
+            return None
+        if cached_stamp != stamp:
+            return None
+        return [Source(*source) for source in sources], errors
+
+    def save_cache(self, stamp, sources, errors):
+        if not self.cache:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache) or '.', exist_ok=True)
+            with open(self.cache + '.tmp', 'wb') as f:
+                f.write(marshal.dumps((stamp, [tuple(source) for source in sources], errors)))
+            os.replace(self.cache + '.tmp', self.cache)
+        except OSError as err:
+            self.logger.error("Failed saving sources cache: %s (%s)", self.cache, err)
+
+    @staticmethod
+    def diff(old, new):
+        """
+        Names of sources added, removed and changed between two loads.
+        diff -> tuple(list, list, list)
+        """
+        added = [name for name in new if name not in old]
+        removed = [name for name in old if name not in new]
+        changed = [name for name in new if name in old and new[name] != old[name]]
+        return added, removed, changed
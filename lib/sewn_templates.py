@@ -0,0 +1,115 @@
+"""
+This file is part of Security Watch Notifier (sewn.py).
+Copyright (C) 2015 Espen Hovind <espehov@ifi.uio.no>
+
+sewn.py is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+sewn.py is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import threading
+
+class SEWNTemplates(object):
+    """
+    Notification templates, each compiled once on first use.
+
+    A template is picked by source (sewn-sources.ini 'template'), then by
+    urgency ([templates] low/normal/critical), then [templates] default.
+    A template that fails to compile is logged once and skipped for the
+    next one. Grouped notifications use [templates] summary.
+    """
+    URGENCIES = ('low', 'normal', 'critical')
+    DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             'templates')
+
+    def __init__(self, cfg, logger, sources):
+        self.cfg = cfg
+        self.logger = logger
+        self.default = cfg.get('templates', 'default', fallback='notification.jin')
+        self.summary = cfg.get('templates', 'summary', fallback='summary.jin')
+        self.by_urgency = {urgency: cfg.get('templates', urgency, fallback=None)
+                           for urgency in self.URGENCIES}
+        self.by_source = dict()
+        # name -> Template, or None if it failed to compile
+        self.templates = dict()
+        self.env = None
+        self.lock = threading.Lock()
+        self.set_sources(sources)
+
+    def set_sources(self, sources):
+        """
+        Templates of the configured sources, compiled again on next use.
+        sources -> dict(name: Source)
+        """
+        with self.lock:
+            self.by_source = {name: source.template for name, source in sources.items()}
+            self.templates = dict()
+            self.env = None
+
+    @classmethod
+    def exists(cls, name):
+        return os.path.isfile(os.path.join(cls.DIRECTORY, name))
+
+    def compile(self, name):
+        """ The compiled template, None if it failed before or fails now. """
+        import jinja2
+        with self.lock:
+            if name not in self.templates:
+                if self.env is None:
+                    self.env = self.init_env(self.cfg)
+                try:
+                    self.templates[name] = self.env.get_template(name)
+                except jinja2.TemplateError as err:
+                    self.logger.error("Failed compiling template: %s (%s)", name, err)
+                    self.templates[name] = None
+            return self.templates[name]
+
+    def select(self, *names):
+        """ The first of names that compiles, raise TemplateError if none does. """
+        import jinja2
+        for name in names:
+            template = self.compile(name) if name else None
+            if template is not None:
+                return template
+        raise jinja2.TemplateError("No usable template: %s" % ', '.join(filter(None, names)))
+
+    def init_env(self, cfg):
+        import jinja2
+        cache_dir = cfg.get('templates', 'cache_dir', fallback=None)
+        bytecode_cache = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            bytecode_cache = jinja2.FileSystemBytecodeCache(cache_dir)
+        return jinja2.Environment(loader=jinja2.PackageLoader('sewn', 'templates'),
+                                  bytecode_cache=bytecode_cache, auto_reload=False)
+
+    def render(self, source, title, link, urgency=1, also=()):
+        """
+        Render a notification, urgency is the D-Bus urgency level 0-2 and
+        also the other sources the article was seen in.
+        message -> tuple(summary, body)
+        """
+        template = self.select(self.by_source.get(source),
+                               self.by_urgency[self.URGENCIES[urgency]], self.default)
+        message = template.render(data=(source, title, link), also=also)
+        summary, _, body = message.partition('\n')
+        return summary, '\r'.join(body.splitlines())
+
+    def render_summary(self, source, articles):
+        """
+        Render one notification for several articles of a source.
+        articles -> list(tuple(title, link))
+        message -> tuple(summary, body)
+        """
+        message = self.select(self.summary).render(source=source, articles=articles)
+        summary, _, body = message.partition('\n')
+        return summary, '\r'.join(body.splitlines())
@@ -16,21 +16,45 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
 """
+import collections
+import json
 import logging
 import logging.config
 import configparser
 import os
+import random
+import sqlite3
 import signal
 import argparse
-import collections
+import contextlib
 import threading
+import time
+
+# Startup is measured from here, before the lib imports
+STARTED = time.monotonic()
 
 from lib.sewn_parser import SEWNParser
-from lib.sewn_parser_rss import SEWNParserRSS
-from lib.sewn_parser_xml import SEWNParserXML
-from lib.sewn_parser_reddit import SEWNParserReddit
-from lib.sewn_parser_gmane import SEWNParserGMANE
-from lib.sewn_parser_atom import SEWNParserAtom
+from lib.sewn_registry import SEWNRegistry
+from lib.sewn_sources import SEWNSources
+from lib.sewn_engine import SEWNEngine
+from lib.sewn_scheduler import SEWNScheduler
+from lib.sewn_history import SEWNHistory
+from lib.sewn_fetcher import SEWNFetcher
+from lib.sewn_matcher import SEWNMatcher
+from lib.sewn_templates import SEWNTemplates
+from lib.sewn_notifier import SEWNNotifier
+from lib.sewn_adaptive import SEWNAdaptive
+from lib.sewn_health import SEWNHealth
+from lib.sewn_cluster import SEWNCluster
+from lib.sewn_advisories import SEWNAdvisories
+from lib.sewn_archive import SEWNArchive
+from lib.sewn_metrics import SEWNMetrics
+from lib.sewn_profiler import SEWNProfiler
+from lib.sewn_pool import SEWNPool
+from lib.sewn_shard import SEWNShard
+from lib.sewn_logging import SEWNLogging
+from lib.sewn_snapshots import SEWNRecorder, SEWNSnapshots
+from lib.sewn_replay import SEWNReplay, SEWNReplayFetcher, SEWNNullNotifier
 import lib.sewn_exceptions as SEWNExceptions
 
 
@@ -42,22 +66,60 @@ class SecurityWatchNotifier(object):
     def __init__(self, args):
         self.args = args
         self.cfg = self.read_config()
-        self.sources = self.read_sources()
         self.logger = self.setup_logging()
-        self.barrier = threading.Barrier(len(self.sources.sections()))
-        self.semaphore = threading.Semaphore(1)
+        # Snapshots of recorded feeds when replaying, see --replay
+        self.snapshots = self.setup_replay() if self.args['replay'] else None
+        self.source_file = SEWNSources(self.cfg, self.logger,
+                                       self.snapshots.sources if self.snapshots else self.SOURCES,
+                                       SEWNRegistry.PARSERS)
+        self.sources = self.read_sources()
+        if self.sources is None:
+            raise SystemExit(1)
+        # source -> job, shared with the engine so a reload takes effect
+        self.jobs = collections.OrderedDict()
+        # Sources added or changed by a reload, checked once without notifying
+        self.quiet = set()
+        self.shard = self.setup_shard()
         self.event = threading.Event()
-        self.articles = collections.deque(maxlen=1000)
+        self.wakeup = threading.Event()
+        # Source check threads of the threaded engine, joined on shutdown
+        self.threads = set()
+        # Set on SIGHUP, the threaded engine reloads from its own loop
+        self.reload_requested = False
+        self.metrics = SEWNMetrics(self.cfg, self.logger)
+        self.profiler = None
+        if self.args['profile']:
+            self.profiler = SEWNProfiler(self.logger, self.args['profile'])
+        self.history = SEWNHistory(self.cfg, self.logger)
+        if len(self.history):
+            # Warm restart, seen articles are loaded from disk. Sources added
+            # while stopped have none yet, and are checked once quietly.
+            SEWNParser.first_run = False
+            self.quiet.update(name for name in self.sources
+                              if not self.history.is_checked(name))
+        if self.snapshots:
+            self.fetcher = SEWNReplayFetcher(self.cfg, self.logger, self.snapshots)
+        else:
+            self.fetcher = SEWNFetcher(self.cfg, self.logger)
+        if self.args['record']:
+            self.fetcher.recorder = self.setup_recorder()
+        self.pool = SEWNPool(self.cfg, self.logger, self.CONFIG)
+        self.templates = SEWNTemplates(self.cfg, self.logger, self.sources)
+        notifier = SEWNNullNotifier if self.snapshots else SEWNNotifier
+        self.notifier = notifier(self.cfg, self.logger, self.templates)
+        self.scheduler = SEWNScheduler(self.cfg, self.logger, self.metrics)
+        self.adaptive = SEWNAdaptive(self.cfg, self.logger, self.scheduler, self.fetcher)
+        self.health = SEWNHealth(self.cfg, self.logger, self.scheduler, self.metrics)
+        self.cluster = SEWNCluster(self.cfg, self.logger, self.fetcher)
+        self.advisories = SEWNAdvisories(self.cfg, self.logger)
+        self.archive = SEWNArchive(self.cfg, self.logger)
 
-        self.sewn_parser = SEWNParser(self.cfg, self.logger, self.articles, self.event)
-        self.sewn_parser_rss = SEWNParserRSS(self.cfg, self.logger, self.articles, self.event)
-        self.sewn_parser_xml = SEWNParserXML(self.cfg, self.logger, self.articles, self.event)
-        self.sewn_parser_reddit = SEWNParserReddit(self.cfg, self.logger, self.articles, self.event)
-        self.sewn_parser_gmane = SEWNParserGMANE(self.cfg, self.logger, self.articles, self.event)
-        self.sewn_parser_atom = SEWNParserAtom(self.cfg, self.logger, self.articles, self.event)
+        self.registry = SEWNRegistry(self.cfg, self.logger, self.history, self.fetcher)
+        self.setup_metrics()
 
         signal.signal(signal.SIGINT, self.cleanup)
         signal.signal(signal.SIGTERM, self.cleanup)
+        signal.signal(signal.SIGHUP, self.request_reload)
 
     def setup_logging(self):
         logging.config.fileConfig(self.CONFIG_LOG)
@@ -66,118 +128,394 @@ class SecurityWatchNotifier(object):
             logger.setLevel(logging.INFO)
         if self.args['debug']:
             logger.setLevel(logging.DEBUG)
+        self.log_pipeline = SEWNLogging(logger)
         return logger
 
+    def setup_shard(self):
+        if self.args['shard']:
+            instance, _, instances = self.args['shard'].partition('/')
+            if not self.cfg.has_section('shard'):
+                self.cfg.add_section('shard')
+            self.cfg.set('shard', 'instance', instance)
+            self.cfg.set('shard', 'instances', instances or '1')
+        try:
+            return SEWNShard(self.cfg, self.logger)
+        except (ValueError, sqlite3.Error) as err:
+            self.logger.error("Failed shard setup: %s", err)
+            raise SystemExit(1)
+
+    def setup_replay(self):
+        """ Load the snapshots to replay, and keep on-disk state out of the replay. """
+        try:
+            snapshots = SEWNSnapshots(self.args['replay'])
+        except OSError as err:
+            self.logger.error("Failed loading snapshots: %s", err)
+            raise SystemExit(1)
+        for section, key, value in (('history', 'path', ''), ('health', 'path', ''),
+                                    ('shard', 'claims', ''), ('archive', 'path', ''),
+                                    ('sources', 'cache', ''), ('metrics', 'port', '0')):
+            if not self.cfg.has_section(section):
+                self.cfg.add_section(section)
+            self.cfg.set(section, key, value)
+        random.seed(SEWNReplay.SEED)
+        self.logger.info("Replay: %s (%d responses)", self.args['replay'], len(snapshots))
+        return snapshots
+
+    def setup_recorder(self):
+        try:
+            return SEWNRecorder(self.logger, self.args['record'], self.SOURCES)
+        except OSError as err:
+            self.logger.error("Failed recording setup: %s", err)
+            raise SystemExit(1)
+
+    def setup_metrics(self):
+        describe = self.metrics.describe
+        describe('sewn_fetch_seconds', 'summary', "Time to fetch a feed.")
+        describe('sewn_fetch_bytes_total', 'counter', "Bytes received, before decoding.")
+        describe('sewn_parse_seconds', 'summary', "Time to parse a feed.")
+        describe('sewn_items_total', 'counter', "Articles parsed.")
+        describe('sewn_new_items_total', 'counter', "Articles not seen before.")
+        describe('sewn_duplicates_total', 'counter', "New articles near-duplicating a recent one.")
+        describe('sewn_followups_total', 'counter', "New articles naming only known advisory ids.")
+        describe('sewn_watched_total', 'counter', "New articles naming a watched advisory id.")
+        describe('sewn_not_modified_total', 'counter', "Checks answered with 304.")
+        describe('sewn_parse_failures_total', 'counter', "Checks that failed.")
+        describe('sewn_checks_skipped_total', 'counter', "Checks skipped during backoff.")
+        describe('sewn_circuit_opened_total', 'counter', "Times a source circuit opened.")
+        describe('sewn_circuits_open', 'gauge', "Sources with an open or half-open circuit.")
+        describe('sewn_sources_failing', 'gauge', "Sources backing off with a closed circuit.")
+        describe('sewn_scheduler_lag_seconds', 'summary', "Actual minus planned check time.")
+        describe('sewn_dedup_hit_ratio', 'gauge', "Share of parsed articles already seen.")
+        describe('sewn_not_modified_ratio', 'gauge', "Share of fetches answered with 304.")
+        describe('sewn_history_articles', 'gauge', "Articles in the seen history.")
+        describe('sewn_cluster_articles', 'gauge', "Recent articles in the duplicate index.")
+        describe('sewn_advisory_ids', 'gauge', "Advisory ids in the index.")
+        describe('sewn_notify_queue_depth', 'gauge', "Articles waiting for notification.")
+        describe('sewn_notify_latency_seconds', 'gauge', "Mean time from queued to sent.")
+        describe('sewn_threads', 'gauge', "Live threads.")
+        describe('sewn_startup_seconds', 'gauge', "Time from start to first check.")
+
+        self.metrics.gauge('sewn_dedup_hit_ratio', self.history.hit_ratio)
+        self.metrics.gauge('sewn_not_modified_ratio', self.fetcher.hit_ratio)
+        self.metrics.gauge('sewn_history_articles', lambda: len(self.history))
+        self.metrics.gauge('sewn_cluster_articles', lambda: len(self.cluster))
+        self.metrics.gauge('sewn_advisory_ids', lambda: len(self.advisories))
+        self.metrics.gauge('sewn_notify_queue_depth', self.notifier.depth)
+        self.metrics.gauge('sewn_notify_latency_seconds', self.notifier.latency)
+        self.metrics.gauge('sewn_threads', threading.active_count)
+        self.metrics.gauge('sewn_circuits_open', self.health.open_count)
+        self.metrics.gauge('sewn_sources_failing', self.health.failing_count)
+
     def read_config(self):
         try:
             cfg = configparser.ConfigParser(allow_no_value=True)
             cfg.read(self.CONFIG)
             return cfg
         except (configparser.Error, IOError) as err:
-            self.logger.error("Failed reading config file: %s" % err)
+            self.logger.error("Failed reading config file: %s", err)
             raise SystemExit(1)
 
     def read_sources(self):
+        """ sources -> dict(name: Source), None if the file cannot be read """
         try:
-            cfg = configparser.ConfigParser()
-            cfg.read(self.SOURCES)
-            return cfg
+            sources = self.source_file.load()
         except (configparser.Error, IOError) as err:
-            self.logger.error("Failed reading sources file: %s" % err)
-            raise SystemExit(1)
+            self.logger.error("Failed reading sources file: %s", err)
+            return None
+        if self.snapshots and self.args['replay_scale'] > 1:
+            sources = SEWNReplay.scale(sources, self.args['replay_scale'])
+        return sources
+
+    def read_jobs(self):
+        """
+        jobs -> dict(source: tuple(parser, source, feed, keywords, next_check, identify))
+        """
+        for source in self.sources.values():
+            job = self.make_job(source)
+            if job:
+                self.jobs[source.name] = job
+
+        self.logger.info("Sources: %d of %d (shard %d/%d)", len(self.jobs),
+                         len(self.sources), self.shard.instance, self.shard.instances)
+        return self.jobs
+
+    def make_job(self, source):
+        """ Return the job of a Source, or None if another instance owns it. """
+        if not self.shard.owns(source.name):
+            return None
+        keywords = SEWNMatcher(source.keywords) if source.keywords else None
+        parser = self.registry.get(source.type)
+        parser.set_streaming(source.name, source.streaming)
+        return (parser, source.name, source.feed, keywords, source.interval, source.identify)
+
+    def request_reload(self, signo, frame):
+        """ Only flag the reload, the handler may interrupt the scheduler holding its lock. """
+        self.reload_requested = True
+        self.wakeup.set()
+
+    def reload(self):
+        """ Apply changes to the sources file, other sources keep their schedule. """
+        sources = self.read_sources()
+        if sources is None:
+            return
+        added, removed, changed = SEWNSources.diff(self.sources, sources)
+        # History has nothing from a new feed or new keywords yet
+        quiet = set(added)
+        for name in changed:
+            old, new = self.sources[name], sources[name]
+            if (old.feed, old.type, old.keywords) != (new.feed, new.type, new.keywords):
+                quiet.add(name)
+        self.sources = sources
+        self.templates.set_sources(sources)
+
+        for name in removed + changed:
+            if self.jobs.pop(name, None):
+                self.scheduler.remove(name)
+        for name in added + changed:
+            job = self.make_job(sources[name])
+            if job:
+                self.jobs[name] = job
+                if name in quiet:
+                    self.quiet.add(name)
+                self.scheduler.add(name, job[4], 0)
+        self.logger.info("Reloaded sources: %d added, %d removed, %d changed | %d checked",
+                         len(added), len(removed), len(changed), len(self.jobs))
+        self.wakeup.set()
 
     def run(self):
-        for source in self.sources.sections():
-            feed = self.sources.get(source, 'feed')
-            next_check = self.sources.getint(source, 'check_interval')
-            identify = self.sources.getboolean(source, 'identify')
+        jobs = self.read_jobs()
+        self.notifier.start()
+        self.metrics.start()
+        self.archive.start()
+        if self.profiler:
+            self.profiler.start()
+        self.log_startup()
+        if self.snapshots:
+            self.run_replay(jobs)
+        elif self.args['engine'] == 'threaded':
+            self.run_threaded(jobs)
+        else:
+            SEWNEngine(self.cfg, self.logger, self.scheduler).run(jobs, self.poll_source,
+                                                                  self.reload)
+            self.shutdown()
+
+    def run_replay(self, jobs):
+        replay = SEWNReplay(self.logger, self.scheduler, self.notifier, self.metrics,
+                            self.snapshots, self.args['replay_speed'])
+        result = replay.run(jobs, self.poll_source)
+        self.shutdown()
+        print("Replayed %d responses: %.1fh in %.2fs (%.0fx)" %
+              (result['responses'], result['simulated_seconds'] / 3600,
+               result['wall_seconds'], result['speedup']))
+        print("checks: %d (%.0f/s) | not modified: %d | failures: %d | skipped: %d" %
+              (result['checks'], result['checks_per_second'], result['not_modified'],
+               result['failures'], result['skipped']))
+        print("items: %d (%.0f/s) | new: %d | duplicates: %d | follow-ups: %d" %
+              (result['items'], result['items_per_second'], result['new_items'],
+               result['duplicates'], result['followups']))
+        print("fetch: %.3fs | parse: %.3fs" % (result['fetch_seconds'], result['parse_seconds']))
+        print("notifications: %d of %d items (%d coalesced) | latency: %.1fs simulated" %
+              (result['notifications'], result['notified_items'], result['coalesced_items'],
+               result['notify_latency_seconds']))
+        if self.args['replay_report']:
+            with open(self.args['replay_report'], 'w') as f:
+                json.dump(result, f, indent=2)
+
+    def log_startup(self):
+        startup = time.monotonic() - STARTED
+        self.metrics.gauge('sewn_startup_seconds', lambda: startup)
+        self.logger.info("Startup: %.3fs", startup)
+        target = self.cfg.getfloat('main', 'startup_target', fallback=0)
+        if target and startup > target:
+            self.logger.warning("Startup: %.3fs exceeds target of %.3fs", startup, target)
+
+    def run_threaded(self, jobs):
+        # Do first run no-notify to avoid spamming. On a warm restart the
+        # history is already populated, so check every source soon instead.
+        delay = 0
+        if SEWNParser.first_run:
+            threads = [self.start_thread(self.parse_sources, job) for job in list(jobs.values())]
+            for t in threads:
+                t.join()
+            SEWNParser.first_run = False
+            self.logger.debug("First run done: %d sources", len(jobs))
+            delay = None
+
+        for job in list(jobs.values()):
+            self.scheduler.add(job[1], job[4], delay)
+
+        # Wait for the next deadline or a reschedule, and start one thread
+        # per due source. Shutdown is handled by cleanup() on signal, and
+        # jobs may change on SIGHUP.
+        while not self.event.is_set():
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload()
+            for source, deadline in self.scheduler.pop_due():
+                job = jobs.get(source)
+                if job:
+                    self.start_thread(self.parse_scheduled, job)
+            self.wakeup.wait(self.scheduler.next_delay())
+            self.wakeup.clear()
 
+    def start_thread(self, func, job):
+        t = threading.Thread(target=func, args=job, name=job[1])
+        t.start()
+        self.threads = {thread for thread in self.threads if thread.is_alive()}
+        self.threads.add(t)
+        self.logger.debug("Active threads (run): %d", threading.active_count())
+        return t
+
+    def poll_source(self, parser, source, feed, keywords, next_check, identify):
+        """ Fetch and parse one source, then notify about new articles. """
+        with SEWNLogging.context(source):
+            self.check_source(parser, source, feed, keywords, next_check, identify)
+
+    def check_source(self, parser, source, feed, keywords, next_check, identify):
+        if not self.health.allow(source):
+            return
+        tracker = self.profiler.track(source) if self.profiler else contextlib.nullcontext()
+        with tracker:
+            start = time.perf_counter()
             try:
-                keywords = self.sources.get(source, 'keywords').split(',')
-            except configparser.NoOptionError:
-                keywords = None
-
-            if self.sources.get(source, 'type') == 'rss':
-                parser = self.sewn_parser_rss
-            elif self.sources.get(source, 'type') == 'xml':
-                parser = self.sewn_parser_xml
-            elif self.sources.get(source, 'type') == 'reddit':
-                parser = self.sewn_parser_reddit
-            elif self.sources.get(source, 'type') == 'gmane':
-                parser = self.sewn_parser_gmane
-            elif self.sources.get(source, 'type') == 'atom':
-                parser = self.sewn_parser_atom
-            else:
-                continue
-
-            t = threading.Thread(target=self.parse_sources,
-                                 args=(parser, source, feed, keywords, next_check, identify),
-                                 name=source)
-            t.start()
-            self.logger.debug("Active threads (run): %d", threading.active_count())
+                # Streaming interleaves fetch and parse, so it stays in-process
+                if self.pool and not parser.streams(source):
+                    articles = self.pool.parse(parser, source, feed, keywords, identify)
+                else:
+                    # Parsers yield lazily, errors surface while consuming
+                    articles = list(parser.parse(source, feed, keywords, next_check, identify))
+            except SEWNExceptions.FeedNotModified:
+                self.logger.debug("Not modified: %s | 304 hit ratio: %.2f",
+                                  source, self.fetcher.hit_ratio())
+                self.metrics.inc('sewn_not_modified_total', source=source)
+                articles = list()
+            except SEWNExceptions.ArticleParseFailed as err:
+                self.logger.error("Failed parsing feed: %s (%s)", err.source, err.message)
+                self.metrics.inc('sewn_parse_failures_total', source=source)
+                self.health.failure(source, next_check, err.message)
+                return
+            finally:
+                fetch_seconds, fetch_bytes = self.fetcher.last_fetch()
+                self.metrics.observe('sewn_fetch_seconds', fetch_seconds, source=source)
+                self.metrics.inc('sewn_fetch_bytes_total', fetch_bytes, source=source)
+            self.metrics.observe('sewn_parse_seconds',
+                                 time.perf_counter() - start - fetch_seconds, source=source)
+            self.health.success(source)
+
+            first_run = SEWNParser.first_run or source in self.quiet
+            new_articles = self.process_articles(parser, articles, keywords,
+                                                 notify=not first_run)
+            self.quiet.discard(source)
+            self.history.checked(source)
+            self.metrics.inc('sewn_items_total', len(articles), source=source)
+            self.metrics.inc('sewn_new_items_total', new_articles, source=source)
+            # Everything is new at first run, so it says nothing about the rate
+            if not first_run:
+                self.adaptive.observe(source, feed, next_check, new_articles)
+
+    def process_articles(self, parser, articles, keywords=None, notify=True):
+        """
+        Notify about (unless notify is False), archive and remember new
+        articles, return how many were new.
+        articles -> tuple(source, title, link)
+        """
+        new_articles = self.history.filter_new(articles)
+        # Articles another instance has already claimed are only remembered
+        claimed = set(self.shard.claim(new_articles))
+        archived = list()
+
+        for source, title, link in new_articles:
+            self.logger.info("NEW: [%s] | %s | %s", source, title.strip(), link.strip())
+            # Near-duplicates of a recent article from any source share a cluster
+            cluster, original = self.cluster.add(source, title, link)
+            if original:
+                self.metrics.inc('sewn_duplicates_total', source=source)
+            # Follow-ups on a known CVE/advisory join the cluster of the first article
+            ids = parser.extract_ids(title, link)
+            cluster, followup, watched = self.advisories.add(ids, (source, title, link),
+                                                             cluster)
+            if followup:
+                self.metrics.inc('sewn_followups_total', source=source)
+            if watched:
+                self.logger.info("WATCHED: [%s] | %s | %s", source, title.strip(),
+                                 ', '.join(sorted(watched)))
+                self.metrics.inc('sewn_watched_total', source=source)
+            # Queued for the dispatcher, which throttles and groups by source and cluster
+            if notify and (source, title, link) in claimed:
+                self.notifier.put(source, title, link, cluster, watched)
+
+            if self.archive:
+                archived.append((source, title.strip(), link.strip(),
+                                 keywords.match(title) if keywords else set(), ids))
+
+            # Add article to history (thread-safe index)
+            parser.add_article(source, title, link)
+        self.archive.add(archived)
+        return len(new_articles)
 
     def parse_sources(self, parser, source, feed, keywords, next_check, identify):
+        self.logger.debug("Parsing: %s", threading.current_thread())
+        self.poll_source(parser, source, feed, keywords, next_check, identify)
+
+    def parse_scheduled(self, parser, source, feed, keywords, next_check, identify):
         try:
-            """
-            articles -> tuple(source, title, link)
-            """
-            self.logger.debug("Parsing: %s", threading.current_thread())
-
-            articles = parser.parse(source, feed, keywords, next_check, identify)
-            new_articles = [art for art in articles if parser.is_new(art[1])]
-
-            for source, title, link in new_articles:
-                # Throttle, one source at a time to properly print at first run,
-                # and group notifications from same source in subsequent runs.
-                self.semaphore.acquire()
-                self.logger.info("NEW: [%s] | %s | %s" %
-                                 (source, title.strip(), link.strip()))
-                if not SEWNParser.first_run:
-                    parser.notify(source, link, title)
-                self.semaphore.release()
-
-                # Add article to history (thread-safe deque)
-                parser.add_article(title)
-
-            # Do first run no-notify to avoid spamming.
-            if SEWNParser.first_run:
-                self.logger.debug("First run: %s | Waiting at barrier: %d ",
-                                  threading.current_thread(), self.barrier.n_waiting)
-                thread_no = self.barrier.wait()
-                # All threads at barrier after first run, thread 0 set False.
-                if thread_no == 0:
-                    SEWNParser.first_run = False
-                self.logger.debug("Passed barrier: %s", threading.current_thread())
-                parser.start_scheduler(next_check, self.parse_sources,
-                                       (parser, source, feed, keywords, next_check, identify))
-            else:
-                parser.next_check_feed(next_check, self.parse_sources,
-                                       (parser, source, feed, keywords, next_check, identify))
-
-        except SEWNExceptions.ArticleParseFailed as err:
-            self.logger.error("Failed parsing feed: %s (%s)" % (err.source, err.message))
-            parser.next_check_feed(next_check, self.parse_sources,
-                                   (parser, source, feed, keywords, next_check, identify))
+            self.parse_sources(parser, source, feed, keywords, next_check, identify)
+        finally:
+            self.scheduler.reschedule(source)
+            self.wakeup.set()
 
     def cleanup(self, signo, frame):
         print("sewn.py shutting down..")
 
-        # Notify thread and skip the next check if before next_datetime
+        # Stop dispatching new checks
         self.event.set()
+        self.wakeup.set()
 
-        # Join all non-main threads
-        thread_main = threading.current_thread()
-        for thread in threading.enumerate():
-            if thread is thread_main:
-                continue
+        # Join the source checks only, the notifier and the process pool
+        # threads are stopped after them by shutdown()
+        for thread in list(self.threads):
             thread.join()
-            self.logger.debug("joined thread: %s" % thread.getName())
+            self.logger.debug("joined thread: %s", thread.getName())
+        self.shutdown()
         raise SystemExit(0)
 
+    def shutdown(self):
+        """ Release shared resources once no source is being checked. """
+        self.notifier.stop(self.cfg.getint('notifier', 'shutdown_timeout', fallback=10))
+        if self.profiler:
+            self.profiler.stop()
+        self.metrics.stop()
+        self.adaptive.log_report()
+        self.health.log_report()
+        self.pool.close()
+        self.fetcher.close()
+        self.shard.close()
+        self.history.close()
+        self.archive.close()
+        self.log_pipeline.close()
+
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("--verbose", action='store_true', help="Display extra information.")
     parser.add_argument("--debug", action='store_true', help="Display debug information.")
+    parser.add_argument("--engine", choices=['asyncio', 'threaded'], default='asyncio',
+                        help="Poll sources from one event loop (default) or a thread per source.")
+    parser.add_argument("--shard", metavar='ID/COUNT',
+                        help="Check only the sources of instance ID out of COUNT, e.g. 0/3.")
+    parser.add_argument("--profile", metavar='FILE',
+                        help="Sample source checks and write collapsed stacks to FILE.")
+    snapshots = parser.add_mutually_exclusive_group()
+    snapshots.add_argument("--record", metavar='DIR',
+                           help="Save every feed response to the snapshot directory DIR.")
+    snapshots.add_argument("--replay", metavar='DIR',
+                           help="Replay the snapshots in DIR in simulated time and exit. "
+                                "Nothing is notified or written to data/.")
+    parser.add_argument("--replay-speed", type=float, default=0, metavar='N',
+                        help="Replay N times faster than real time (default: no waiting).")
+    parser.add_argument("--replay-scale", type=int, default=1, metavar='N',
+                        help="Replay every source N times, for load beyond the recording.")
+    parser.add_argument("--replay-report", metavar='FILE',
+                        help="Write replay counts and timings as JSON.")
     return vars(parser.parse_args())
 
 def main():
@@ -185,10 +523,8 @@ def main():
         os.mkdir('logs')
     args = parse_args()
     security_watch_notifier = SecurityWatchNotifier(args)
+    # Blocks until SIGINT/SIGTERM.
     security_watch_notifier.run()
-    # Pause main thread after worker threads have been started.
-    # Wait for signal and handle shutdown.
-    signal.pause()
 
 if __name__ == '__main__':
     main()
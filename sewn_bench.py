@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+This file is part of Security Watch Notifier (sewn.py).
+Copyright (C) 2015 Espen Hovind <espehov@ifi.uio.no>
+
+sewn.py is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+sewn.py is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import argparse
+import configparser
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import time
+
+from lib.sewn_parser_rss import SEWNParserRSS
+from lib.sewn_parser_xml import SEWNParserXML
+from lib.sewn_parser_reddit import SEWNParserReddit
+from lib.sewn_parser_gmane import SEWNParserGMANE
+from lib.sewn_parser_atom import SEWNParserAtom
+from lib.sewn_history import SEWNHistory
+from lib.sewn_fetcher import SEWNFetcher
+from lib.sewn_fixtures import FEEDS, SEWNFixtureServer
+
+
+class SEWNBench(object):
+    """
+    Fetch+parse and dedup benchmarks against synthetic feeds served locally.
+    Every case runs in a fresh process, so its peak RSS is its own.
+    """
+    CONFIG = os.getcwd() + '/config/sewn.ini'
+    PARSERS = {'rss': SEWNParserRSS,
+               'atom': SEWNParserAtom,
+               'gmane': SEWNParserGMANE,
+               'xml': SEWNParserXML,
+               'reddit': SEWNParserReddit}
+
+    def __init__(self, args):
+        self.args = args
+        self.logger = logging.getLogger()
+        self.cfg = configparser.ConfigParser(allow_no_value=True)
+        self.cfg.read(self.CONFIG)
+        # Benchmarks never touch the on-disk history
+        self.cfg.set('history', 'path', '')
+
+    def run(self):
+        documents = {'/%s/%d' % (kind, items): (generate(items), content_type)
+                     for kind, (generate, content_type) in FEEDS.items()
+                     for items in self.args['items']}
+
+        results = list()
+        context = multiprocessing.get_context('spawn')
+        with SEWNFixtureServer(documents) as server:
+            for kind in self.args['types']:
+                for items in self.args['items']:
+                    for streaming in self.modes(kind):
+                        with context.Pool(1) as pool:
+                            results.append(pool.apply(
+                                self.bench, (kind, items, streaming,
+                                             server.url('/%s/%d' % (kind, items)),
+                                             len(documents['/%s/%d' % (kind, items)][0]))))
+        return {'python': platform.python_version(),
+                'platform': platform.platform(),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'rounds': self.args['rounds'],
+                'results': results}
+
+    def modes(self, kind):
+        if self.args['streaming'] and self.PARSERS[kind].ITEM_TAG:
+            return (False, True)
+        return (False,)
+
+    def bench(self, kind, items, streaming, url, size):
+        fetcher = SEWNFetcher(self.cfg, self.logger)
+        history = SEWNHistory(self.cfg, self.logger)
+        parser = self.PARSERS[kind](self.cfg, self.logger, history, fetcher)
+        parser.streaming = streaming
+
+        parse_times = list()
+        dedup_times = list()
+        for _ in range(self.args['rounds']):
+            history.index.clear()
+            start = time.perf_counter()
+            articles = list(parser.parse(kind, url, None, 0, False))
+            parse_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            new_articles = history.filter_new(articles)
+            for article in new_articles:
+                history.add(*article)
+            history.filter_new(articles)
+            dedup_times.append(time.perf_counter() - start)
+        fetcher.close()
+
+        parse_time = statistics.median(parse_times)
+        dedup_time = statistics.median(dedup_times)
+        return {'type': kind,
+                'items': items,
+                'streaming': streaming,
+                'bytes': size,
+                'parsed': len(articles),
+                'parse_seconds': parse_time,
+                'items_per_second': len(articles) / parse_time if parse_time else 0.0,
+                'item_latency_us': parse_time / max(len(articles), 1) * 1e6,
+                # Two filter_new() lookups and one add() per item
+                'dedup_item_us': dedup_time / max(len(articles), 1) * 1e6,
+                'peak_rss_kb': peak_rss_kb()}
+
+
+def peak_rss_kb():
+    """
+    Peak RSS of this process. ru_maxrss is kept across exec on Linux, so it
+    would include the parent of a spawned process; VmHWM starts afresh.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def compare(baseline, results):
+    """ Print items/s of results relative to a baseline run. """
+    old = {(r['type'], r['items'], r['streaming']): r for r in baseline['results']}
+    for r in results['results']:
+        key = (r['type'], r['items'], r['streaming'])
+        if key in old and old[key]['items_per_second']:
+            print("%-6s %7d %-9s %10.0f items/s  %+6.1f%%" %
+                  (r['type'], r['items'], 'streaming' if r['streaming'] else 'dom',
+                   r['items_per_second'],
+                   (r['items_per_second'] / old[key]['items_per_second'] - 1) * 100))
+
+def report(results):
+    print("%-6s %7s %-9s %10s %12s %12s %10s" %
+          ('type', 'items', 'mode', 'items/s', 'item us', 'dedup us', 'rss kb'))
+    for r in results['results']:
+        print("%-6s %7d %-9s %10.0f %12.2f %12.2f %10d" %
+              (r['type'], r['items'], 'streaming' if r['streaming'] else 'dom',
+               r['items_per_second'], r['item_latency_us'], r['dedup_item_us'],
+               r['peak_rss_kb']))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark sewn.py parsers.")
+    parser.add_argument("--types", nargs='+', choices=sorted(FEEDS), default=sorted(FEEDS),
+                        help="Feed types to benchmark.")
+    parser.add_argument("--items", nargs='+', type=int, default=[100, 1000],
+                        help="Items per synthetic feed.")
+    parser.add_argument("--rounds", type=int, default=5, help="Runs per case, median is kept.")
+    parser.add_argument("--streaming", action='store_true',
+                        help="Also benchmark the streaming parse mode.")
+    parser.add_argument("--output", default='bench.json', help="Write results as JSON.")
+    parser.add_argument("--compare", help="Compare with results from an earlier run.")
+    return vars(parser.parse_args())
+
+def main():
+    args = parse_args()
+    results = SEWNBench(args).run()
+    with open(args['output'], 'w') as f:
+        json.dump(results, f, indent=2)
+    report(results)
+    if args['compare']:
+        with open(args['compare']) as f:
+            compare(json.load(f), results)
+
+if __name__ == '__main__':
+    main()
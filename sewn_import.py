@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+This file is part of Security Watch Notifier (sewn.py).
+Copyright (C) 2015 Espen Hovind <espehov@ifi.uio.no>
+
+sewn.py is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+sewn.py is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with sewn.py.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import argparse
+import configparser
+import io
+import logging
+import os
+import sys
+import urllib.parse
+from lxml import etree
+
+from lib.sewn_registry import SEWNRegistry
+from lib.sewn_sources import SEWNSources
+
+
+class SEWNImport(object):
+    """
+    Add the feeds of an OPML file to sewn-sources.ini.
+
+    Feeds already in the file are skipped, names are made unique, and every
+    new source is validated like sewn.py does before it is written. New
+    sections are appended, so comments in the file are kept. Send sewn.py
+    SIGHUP to start checking them.
+    """
+    SOURCES = os.getcwd() + '/config/sewn-sources.ini'
+
+    def __init__(self, args):
+        self.args = args
+        self.logger = logging.getLogger()
+        self.validator = SEWNSources(configparser.ConfigParser(), self.logger,
+                                     args['sources'], SEWNRegistry.PARSERS)
+
+    def run(self):
+        existing = configparser.ConfigParser(interpolation=None)
+        existing.read(self.args['sources'])
+        names = set(existing.sections())
+        feeds = {existing.get(name, 'feed', fallback='').strip().replace('%%', '%')
+                 for name in names}
+
+        new = configparser.ConfigParser(interpolation=None)
+        skipped = 0
+        for name, feed, kind in self.read_opml(self.args['opml']):
+            if feed in feeds:
+                skipped += 1
+                continue
+            name = self.unique(name or urllib.parse.urlsplit(feed).hostname or feed, names)
+            kind = self.args['type'] or kind or self.guess_type(feed)
+            # Written for sewn.py's interpolating parser, so % must be doubled
+            new[name] = {'feed': feed.replace('%', '%%'), 'type': kind,
+                         'check_interval': str(self.args['interval']),
+                         'identify': 'false'}
+            try:
+                self.validator.validate(name, self.section(new, name))
+            except (ValueError, configparser.Error) as err:
+                self.logger.error("Skipped: %s (%s)", name, err)
+                new.remove_section(name)
+                continue
+            names.add(name)
+            feeds.add(feed)
+
+        text = io.StringIO()
+        new.write(text)
+        if self.args['dry_run']:
+            sys.stdout.write(text.getvalue())
+        elif new.sections():
+            with open(self.args['sources'], 'a') as f:
+                f.write('\n' + text.getvalue())
+        print("Imported: %d | already present: %d" % (len(new.sections()), skipped))
+
+    @staticmethod
+    def section(cfg, name):
+        """ A section of cfg read back the way sewn.py reads it. """
+        check = configparser.ConfigParser()
+        check.read_dict({name: dict(cfg[name])}, source='<opml>')
+        return check[name]
+
+    @staticmethod
+    def read_opml(path):
+        """
+        Every outline with a feed URL, nested folders included.
+        outline -> tuple(name, feed, type or None)
+        """
+        doc = etree.parse(path, etree.XMLParser(recover=True))
+        for outline in doc.iter('outline'):
+            feed = (outline.get('xmlUrl') or '').strip()
+            if not feed:
+                continue
+            name = ' '.join((outline.get('title') or outline.get('text') or '').split())
+            kind = (outline.get('type') or '').strip().lower()
+            yield name, feed, kind if kind == 'atom' else None
+
+    @staticmethod
+    def guess_type(feed):
+        url = urllib.parse.urlsplit(feed)
+        host = url.hostname or ''
+        if host.endswith('reddit.com') and url.path.endswith('.json'):
+            return 'reddit'
+        if host.endswith('gmane.org'):
+            return 'gmane'
+        if 'atom' in url.path.lower():
+            return 'atom'
+        return 'rss'
+
+    @staticmethod
+    def unique(name, names):
+        # Brackets and newlines do not survive a section header
+        name = name.replace('[', '(').replace(']', ')')
+        candidate, n = name, 2
+        while candidate in names:
+            candidate = '%s (%d)' % (name, n)
+            n += 1
+        return candidate
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Import OPML feeds as sewn.py sources.")
+    parser.add_argument("opml", help="OPML file to import.")
+    parser.add_argument("--sources", default=SEWNImport.SOURCES,
+                        help="Sources file to add to (default config/sewn-sources.ini).")
+    parser.add_argument("--interval", type=int, default=3600,
+                        help="check_interval of imported sources, in seconds.")
+    parser.add_argument("--type", choices=sorted(SEWNRegistry.PARSERS),
+                        help="Type of every imported source (default: guess from the URL).")
+    parser.add_argument("--dry-run", action='store_true',
+                        help="Print the new sources instead of adding them.")
+    return vars(parser.parse_args())
+
+def main():
+    logging.basicConfig(format='%(levelname)-6s: %(message)s')
+    SEWNImport(parse_args()).run()
+
+if __name__ == '__main__':
+    main()